@@ -1,6 +1,7 @@
 from datetime import timedelta
 from pathlib import Path
 
+from celery.schedules import crontab
 from decouple import Csv, config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -107,6 +108,9 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Загруженные CSV для фонового импорта (не раздаются); общий том web и celery_worker
+MEDIA_ROOT = config("MEDIA_ROOT", default=str(BASE_DIR / "media"))
+
 # ─── Misc ─────────────────────────────────────────────────────────────────────
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -170,6 +174,44 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    "sweep-budget-periods": {
+        "task": "transactions.tasks.sweep_budget_periods_task",
+        "schedule": crontab(minute="*/15"),
+    },
+    "fail-stale-import-jobs": {
+        "task": "transactions.tasks.fail_stale_import_jobs_task",
+        "schedule": crontab(minute="*/15"),
+    },
+    "fail-stale-export-jobs": {
+        "task": "transactions.tasks.fail_stale_export_jobs_task",
+        "schedule": crontab(minute="*/15"),
+    },
+}
+
+# ─── Budgets ──────────────────────────────────────────────────────────────────
+
+# "deferred" — проверка бюджета в Celery после коммита, "sync" — прямо в post_save
+BUDGET_EVALUATION_MODE = config("BUDGET_EVALUATION_MODE", default="deferred")
+BUDGET_EVALUATION_DEBOUNCE = config("BUDGET_EVALUATION_DEBOUNCE", default=5, cast=int)
+BUDGET_SWEEP_CHUNK_SIZE = config("BUDGET_SWEEP_CHUNK_SIZE", default=500, cast=int)
+
+# Размер пачки bulk_create при импорте CSV
+CSV_IMPORT_BATCH_SIZE = config("CSV_IMPORT_BATCH_SIZE", default=1000, cast=int)
+# "auto" — COPY через staging-таблицу на PostgreSQL 16+, иначе bulk_create ("orm")
+CSV_IMPORT_MODE = config("CSV_IMPORT_MODE", default="auto")
+# Процессов для проверки строк в режиме "orm"; 1 — проверка в текущем процессе.
+# Не действует в воркере Celery с пулом prefork (его процессы — демоны):
+# только benchmark_import и `celery worker --pool=solo`.
+CSV_IMPORT_WORKERS = config("CSV_IMPORT_WORKERS", default=1, cast=int)
+# "auto" — экспорт CSV через COPY TO на PostgreSQL, иначе csv.writer ("orm")
+CSV_EXPORT_MODE = config("CSV_EXPORT_MODE", default="auto")
+# Импорт читает файл потоково, поэтому предел задаёт диск, а не память
+CSV_IMPORT_MAX_UPLOAD_MB = config("CSV_IMPORT_MAX_UPLOAD_MB", default=200, cast=int)
+
+# Фоновое задание без пульса дольше этого считается прерванным (воркер погиб)
+JOB_STALE_MINUTES = config("JOB_STALE_MINUTES", default=30, cast=int)
 
 # ─── Email ────────────────────────────────────────────────────────────────────
 
@@ -1,6 +1,15 @@
 from django.contrib import admin
 
-from .models import BudgetLimit, Category, Transaction
+from .models import (
+    BudgetAlertState,
+    BudgetLimit,
+    Category,
+    ExportJob,
+    ImportJob,
+    MonthlyRollup,
+    SpendCounter,
+    Transaction,
+)
 
 
 @admin.register(Category)
@@ -32,3 +41,50 @@ class BudgetLimitAdmin(admin.ModelAdmin):
     list_display = ("user", "category", "limit_amount", "period")
     list_filter = ("period",)
     list_select_related = ("user", "category")
+
+
+@admin.register(SpendCounter)
+class SpendCounterAdmin(admin.ModelAdmin):
+    list_display = ("user", "category", "period", "period_start", "amount")
+    list_filter = ("period",)
+    list_select_related = ("user", "category")
+    date_hierarchy = "period_start"
+
+
+@admin.register(BudgetAlertState)
+class BudgetAlertStateAdmin(admin.ModelAdmin):
+    list_display = ("budget", "period_start", "state", "spent", "notified_at")
+    list_filter = ("state", "notify_pending")
+    list_select_related = ("budget__user", "budget__category")
+
+
+@admin.register(MonthlyRollup)
+class MonthlyRollupAdmin(admin.ModelAdmin):
+    list_display = ("user", "month", "type", "category", "total", "count")
+    list_filter = ("type",)
+    list_select_related = ("user", "category")
+    date_hierarchy = "month"
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "user",
+        "file_name",
+        "status",
+        "rows_created",
+        "rows_failed",
+        "rows_skipped",
+        "created_at",
+    )
+    list_filter = ("status",)
+    list_select_related = ("user",)
+    readonly_fields = ("file_hash", "errors")
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("user", "format", "status", "rows", "duration", "created_at")
+    list_filter = ("status", "format")
+    list_select_related = ("user",)
+    readonly_fields = ("params_hash", "data_version", "filters")
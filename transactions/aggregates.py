@@ -0,0 +1,310 @@
+"""
+Поддерживаемые агрегаты по транзакциям.
+
+SpendCounter хранит сумму расходов по (user, category, period, period_start),
+поэтому проверка бюджета читает готовые значения, а не сканирует историю.
+MonthlyRollup хранит сумму и число транзакций по (user, month, type, category)
+для статистики и сводок.
+
+Оба агрегата меняются на разницу при каждой записи в той же транзакции БД
+и пересчитываются из Transaction командами rebuild_spend_counters и
+rebuild_monthly_rollups.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import BudgetLimit, MonthlyRollup, SpendCounter, Transaction
+from .utils import get_period_start
+
+PERIOD_TRUNCS = {"DAY": TruncDay, "WEEK": TruncWeek, "MONTH": TruncMonth}
+
+UPSERT_SQL = """
+    INSERT INTO {table} (user_id, category_id, period, period_start, amount)
+    VALUES {values}
+    ON CONFLICT (user_id, category_id, period, period_start)
+    DO UPDATE SET amount = {table}.amount + EXCLUDED.amount
+"""
+
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO {table} (user_id, month, type, category_id, total, count)
+    VALUES {values}
+    ON CONFLICT (user_id, month, type, category_id)
+    DO UPDATE SET total = {table}.total + EXCLUDED.total,
+                  count = {table}.count + EXCLUDED.count
+"""
+
+
+def spend_deltas(state, sign=1, deltas=None):
+    """Вклад транзакции в счётчики: {(user, category, period, start): сумма}."""
+    deltas = defaultdict(Decimal) if deltas is None else deltas
+    if (
+        state is None
+        or state["type"] != Transaction.EXPENSE
+        or state["category_id"] is None
+    ):
+        return deltas
+
+    for period in PERIOD_TRUNCS:
+        key = (
+            state["user_id"],
+            state["category_id"],
+            period,
+            get_period_start(period, state["date"]),
+        )
+        deltas[key] += sign * state["amount"]
+    return deltas
+
+
+def transaction_change_deltas(old_state, new_state):
+    """Разница счётчиков при переходе транзакции из old_state в new_state."""
+    deltas = spend_deltas(old_state, sign=-1)
+    spend_deltas(new_state, deltas=deltas)
+    return {key: amount for key, amount in deltas.items() if amount}
+
+
+def apply_spend_deltas(deltas):
+    """
+    Атомарно применяет разницу к счётчикам.
+
+    Положительные суммы — один INSERT ... ON CONFLICT на все ключи.
+    Отрицательные только уменьшают существующие строки: при каскадном
+    удалении пользователя или категории счётчиков уже может не быть.
+    """
+    increments = [(key, amount) for key, amount in deltas.items() if amount > 0]
+    decrements = [(key, amount) for key, amount in deltas.items() if amount < 0]
+
+    with transaction.atomic():
+        if increments:
+            sql = UPSERT_SQL.format(
+                table=SpendCounter._meta.db_table,
+                values=", ".join(["(%s, %s, %s, %s, %s)"] * len(increments)),
+            )
+            params = [value for key, amount in increments for value in (*key, amount)]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+        for (user_id, category_id, period, period_start), amount in decrements:
+            SpendCounter.objects.filter(
+                user_id=user_id,
+                category_id=category_id,
+                period=period,
+                period_start=period_start,
+            ).update(amount=F("amount") + amount)
+
+
+def rollup_change_deltas(old_state, new_state):
+    """Разница месячных сводок: {(user, month, type, category): [сумма, число]}."""
+    deltas = defaultdict(lambda: [Decimal("0"), 0])
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is not None:
+            add_rollup_delta(deltas, state, sign)
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+
+def add_rollup_delta(deltas, state, sign=1):
+    key = (
+        state["user_id"],
+        state["date"].replace(day=1),
+        state["type"],
+        state["category_id"],
+    )
+    delta = deltas.setdefault(key, [Decimal("0"), 0])
+    delta[0] += sign * state["amount"]
+    delta[1] += sign * state.get("count", 1)
+
+
+def insert_deltas(states, spend=None, rollup=None):
+    """
+    Суммарные дельты обоих агрегатов для пачки новых транзакций.
+    Переданные spend/rollup дополняются — так дельты копятся по пачкам.
+    Состояние может описывать группу транзакций: тогда в нём есть count.
+    """
+    spend = {} if spend is None else spend
+    rollup = {} if rollup is None else rollup
+    for state in states:
+        for key, amount in spend_deltas(state).items():
+            spend[key] = spend.get(key, Decimal("0")) + amount
+        add_rollup_delta(rollup, state)
+    return spend, rollup
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Применяет разницу к MonthlyRollup по тем же правилам, что и счётчики.
+    Ограничение уникальности не различает NULL-категории, поэтому строка
+    без категории обновляется тем же INSERT ... ON CONFLICT. На СУБД без
+    NULLS NOT DISTINCT (SQLite) строки обновляются через UPDATE и
+    создаются при отсутствии.
+    """
+    increments, others = [], []
+    for key, (amount, count) in deltas.items():
+        if count > 0 or (count == 0 and amount > 0):
+            increments.append((key, amount, count))
+        else:
+            others.append((key, amount, count))
+
+    with transaction.atomic():
+        if connection.features.supports_nulls_distinct_unique_constraints:
+            if increments:
+                sql = ROLLUP_UPSERT_SQL.format(
+                    table=MonthlyRollup._meta.db_table,
+                    values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(increments)),
+                )
+                params = [
+                    value
+                    for key, amount, count in increments
+                    for value in (*key, amount, count)
+                ]
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+        else:
+            for key, amount, count in increments:
+                updated = rollup_rows(key).update(
+                    total=F("total") + amount, count=F("count") + count
+                )
+                if not updated:
+                    MonthlyRollup.objects.create(
+                        user_id=key[0],
+                        month=key[1],
+                        type=key[2],
+                        category_id=key[3],
+                        total=amount,
+                        count=count,
+                    )
+        for key, amount, count in others:
+            rollup_rows(key).update(total=F("total") + amount, count=F("count") + count)
+
+
+def rollup_rows(key):
+    user_id, month, type_, category_id = key
+    return MonthlyRollup.objects.filter(
+        user_id=user_id, month=month, type=type_, category_id=category_id
+    )
+
+
+def merge_category_rollups(category_id):
+    """
+    Переносит месячные сводки удаляемой категории в строки без категории:
+    её транзакции остаются, но теряют категорию (SET_NULL).
+    """
+    with transaction.atomic():
+        rows = MonthlyRollup.objects.select_for_update().filter(category_id=category_id)
+        deltas = {}
+        for row in rows.values("user_id", "month", "type", "total", "count"):
+            add_rollup_delta(
+                deltas,
+                {
+                    "user_id": row["user_id"],
+                    "date": row["month"],
+                    "type": row["type"],
+                    "category_id": None,
+                    "amount": row["total"],
+                    "count": row["count"],
+                },
+            )
+        rows.delete()
+        apply_rollup_deltas(deltas)
+
+
+def apply_transaction_change(old_state, new_state):
+    """Обновляет все агрегаты; возвращает дельты счётчиков и месячных сводок."""
+    spend = transaction_change_deltas(old_state, new_state)
+    rollup = rollup_change_deltas(old_state, new_state)
+    apply_spend_deltas(spend)
+    apply_rollup_deltas(rollup)
+    return spend, rollup
+
+
+def rebuild_spend_counters(user_ids=None, batch_size=1000):
+    """
+    Пересчитывает счётчики из Transaction. Возвращает число строк.
+    Кэш оповещений и прогноза пользователей с лимитами сбрасывается после
+    коммита — иначе исправленные траты были бы видны только со сменой дня.
+    """
+    from .caching import invalidate_budget_alerts_on_commit
+
+    expenses = Transaction.objects.filter(
+        type=Transaction.EXPENSE, category__isnull=False
+    )
+    counters = SpendCounter.objects.all()
+    budgets = BudgetLimit.objects.all()
+    if user_ids is not None:
+        expenses = expenses.filter(user_id__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+        budgets = budgets.filter(user_id__in=user_ids)
+
+    created = 0
+    with transaction.atomic():
+        counters.delete()
+        for period, trunc in PERIOD_TRUNCS.items():
+            rows = (
+                expenses.annotate(period_start=trunc("date"))
+                .values("user_id", "category_id", "period_start")
+                .annotate(total=Sum("amount"))
+                .order_by()
+            )
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(
+                    SpendCounter(
+                        user_id=row["user_id"],
+                        category_id=row["category_id"],
+                        period=period,
+                        period_start=row["period_start"],
+                        amount=row["total"],
+                    )
+                )
+                if len(batch) >= batch_size:
+                    created += len(SpendCounter.objects.bulk_create(batch))
+                    batch = []
+            created += len(SpendCounter.objects.bulk_create(batch))
+        for user_id in budgets.values_list("user_id", flat=True).distinct():
+            invalidate_budget_alerts_on_commit(user_id)
+    return created
+
+
+def rebuild_monthly_rollups(user_ids=None, batch_size=1000):
+    """
+    Пересчитывает MonthlyRollup из Transaction. Возвращает число строк.
+    После коммита у затронутых пользователей поднимается версия данных и
+    сбрасывается hash статистики — иначе сводки и графики отдавали бы
+    прежние суммы до следующей записи.
+    """
+    from .caching import bump_data_version_on_commit, invalidate_statistics_on_commit
+
+    transactions = Transaction.objects.all()
+    rollups = MonthlyRollup.objects.all()
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    rows = (
+        transactions.annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "type", "category_id")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    created = 0
+    with transaction.atomic():
+        rebuilt_users = set()
+        for queryset in (rollups, transactions):
+            rebuilt_users.update(
+                queryset.order_by().values_list("user_id", flat=True).distinct()
+            )
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(MonthlyRollup(**row))
+            if len(batch) >= batch_size:
+                created += len(MonthlyRollup.objects.bulk_create(batch))
+                batch = []
+        created += len(MonthlyRollup.objects.bulk_create(batch))
+        for user_id in rebuilt_users:
+            bump_data_version_on_commit(user_id)
+            invalidate_statistics_on_commit(user_id)
+    return created
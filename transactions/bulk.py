@@ -0,0 +1,108 @@
+"""
+Пакетная запись транзакций в обход сигналов.
+
+bulk_create, bulk_update и удаление одним DELETE не шлют сигналы, поэтому
+агрегаты, кэш и проверка бюджета обновляются явно — один раз на пакет по
+накопленным дельтам (см. aggregates). Этим пользуются импорт CSV, чистка
+повторов и пакетный API.
+"""
+
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .aggregates import apply_rollup_deltas, apply_spend_deltas, insert_deltas
+from .caching import (
+    bump_data_version_on_commit,
+    invalidate_budget_alerts_for_deltas,
+    patch_cached_statistics_on_commit,
+)
+from .models import Transaction
+from .utils import request_budget_evaluation
+
+DELETE_TRANSACTIONS_SQL = "DELETE FROM {table} WHERE id IN ({ids})"
+BULK_BATCH_SIZE = 1000
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def removal_state(state):
+    """Состояние для insert_deltas, которое вычитает транзакцию из агрегатов."""
+    return {**state, "amount": -state["amount"], "count": -1}
+
+
+def apply_bulk_effects(user, spend, rollup, has_expenses):
+    """Агрегаты, кэш и проверка бюджета — один раз на весь пакет."""
+    spend = {key: amount for key, amount in spend.items() if amount}
+    rollup = {key: delta for key, delta in rollup.items() if any(delta)}
+    apply_spend_deltas(spend)
+    apply_rollup_deltas(rollup)
+    invalidate_budget_alerts_for_deltas(spend)
+    patch_cached_statistics_on_commit(rollup)
+    bump_data_version_on_commit(user.pk)
+    if has_expenses:
+        request_budget_evaluation(user)
+
+
+def delete_transactions(ids, batch_size=BULK_BATCH_SIZE):
+    """Удаляет транзакции пачками без сигналов — агрегаты на вызывающем."""
+    with connection.cursor() as cursor:
+        for batch in batched(ids, batch_size):
+            cursor.execute(
+                DELETE_TRANSACTIONS_SQL.format(
+                    table=Transaction._meta.db_table,
+                    ids=", ".join(["%s"] * len(batch)),
+                ),
+                batch,
+            )
+
+
+def write_transaction_batch(user, create=(), update=(), delete=()):
+    """
+    Применяет пакет в одной транзакции БД.
+    create — данные новых транзакций, update — пары (транзакция из БД,
+    изменённые поля), delete — транзакции из БД, прочитанные с блокировкой
+    в той же транзакции. Каждое изменение пишет только свои поля: пачки
+    bulk_update группируются по набору полей. Возвращает (созданные,
+    обновлённые).
+    """
+    states, updates_by_fields = [], {}
+    created = [Transaction(user=user, **data) for data in create]
+    for instance in created:
+        instance.fingerprint = instance.compute_fingerprint()
+        states.append(instance.get_ledger_state())
+
+    updated = []
+    for instance, data in update:
+        states.append(removal_state(instance._ledger_state))
+        for field, value in data.items():
+            setattr(instance, field, value)
+        instance.fingerprint = instance.compute_fingerprint()
+        instance._ledger_state = instance.get_ledger_state()
+        states.append(instance._ledger_state)
+        fields = tuple(sorted({"fingerprint", *data}))
+        updates_by_fields.setdefault(fields, []).append(instance)
+        updated.append(instance)
+
+    states.extend(removal_state(instance._ledger_state) for instance in delete)
+
+    with transaction.atomic():
+        Transaction.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        for fields, instances in updates_by_fields.items():
+            Transaction.objects.bulk_update(
+                instances, fields, batch_size=BULK_BATCH_SIZE
+            )
+        delete_transactions([instance.pk for instance in delete])
+        if states:
+            spend, rollup = insert_deltas(states)
+            apply_bulk_effects(
+                user,
+                spend,
+                rollup,
+                any(state["type"] == Transaction.EXPENSE for state in states),
+            )
+    return created, updated
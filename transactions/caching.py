@@ -0,0 +1,377 @@
+"""
+Кэш результатов, которые страницы читают чаще, чем меняются данные.
+
+У каждого пользователя есть версия данных: она растёт при любой записи
+Transaction, Category или BudgetLimit (в том числе массовой). Ключи и ETag
+из data_cache_key/data_etag включают версию, поэтому представлению достаточно
+кэшировать по такому ключу — сигналы трогать не нужно, а старые записи
+просто истекают.
+
+Оповещения и прогноз по бюджету кэшируются по пользователю под
+версионированным ключом. Версия увеличивается только при записях, которые
+меняют траты в текущем окне бюджетной категории, или при изменении лимитов.
+В ключ входит текущая дата, поэтому окна DAY/WEEK/MONTH сменяются сами.
+
+Статистика хранится в Redis как hash помесячных корзин (в копейках).
+Каждая запись после коммита прибавляет к своей корзине разницу через HINCRBY,
+так что кэш остаётся тёплым и точным. Если hash нет или его версия не
+совпадает, статистика пересчитывается из MonthlyRollup. Ещё до коммита
+запись поднимает поколение и счётчик ожидающих дельт: пересчёт, прочитавший
+MonthlyRollup между коммитом и дельтой, не положит в hash сумму, к которой
+дельта потом прибавится второй раз.
+
+Через STATS_FRESH_SECONDS данные считаются устаревшими: их всё равно отдают
+сразу, а пересчёт уходит в Celery под поодиночной блокировкой пользователя
+(stale-while-revalidate), так что истечение не вызывает лавину пересчётов.
+"""
+
+import hashlib
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .forecasting import forecast_budgets
+from .models import BudgetLimit, Transaction
+from .reports import monthly_statistics, monthly_totals
+from .utils import check_budget_limits, get_period_starts
+
+BUDGET_ALERTS_HITS_KEY = "budget_alerts_hits"
+BUDGET_ALERTS_MISSES_KEY = "budget_alerts_misses"
+
+DATA_CACHE_TIMEOUT = 60 * 60
+
+STATS_VERSION = "1"
+STATS_TTL = 60 * 60 * 24 * 30
+STATS_FRESH_SECONDS = 60 * 15
+STATS_LOCK_TIMEOUT = 60
+STATS_REFRESH_INTERVAL = 60
+# Сколько живёт отметка о дельте, которая не дошла (откат транзакции).
+STATS_PENDING_TTL = 60 * 5
+
+# KEYS: hash, поколение, число ожидающих дельт. ARGV: TTL, TTL ожидания.
+# Вызывается до коммита: заполнения, начатые раньше, и заполнения до самой
+# дельты отклоняются.
+BEGIN_PATCH_STATS_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+"""
+
+# KEYS: как выше. ARGV: версия, TTL, затем пары поле/дельта.
+# Поколение растёт и здесь — так заполнение, прочитавшее данные до коммита,
+# не затрёт дельту.
+PATCH_STATS_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('DECR', KEYS[3]) <= 0 then
+    redis.call('DEL', KEYS[3])
+end
+if redis.call('HGET', KEYS[1], '__version__') ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# ARGV: поколение на момент чтения MonthlyRollup, TTL, затем пары поле/значение.
+FILL_STATS_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1]
+    or tonumber(redis.call('GET', KEYS[3]) or '0') > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def incr_counter(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def seconds_until_tomorrow():
+    now = timezone.localtime()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(int((timezone.make_aware(tomorrow) - now).total_seconds()), 1)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Стартуем со времени, а не с нуля: после вытеснения ключа версии
+        # старые записи не должны снова стать «свежими».
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def data_version(user_id):
+    return get_version(f"data_version_{user_id}")
+
+
+def bump_data_version(user_id):
+    bump_version(f"data_version_{user_id}")
+
+
+def bump_data_version_on_commit(user_id):
+    transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+def data_cache_key(prefix, user_id, *parts):
+    """Ключ кэша, который устаревает с любой записью данных пользователя."""
+    key = f"{prefix}_{user_id}_d{data_version(user_id)}"
+    if parts:
+        key += (
+            "_" + hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+        )
+    return key
+
+
+def data_etag(key):
+    """ETag по ключу data_cache_key: совпадает, пока данные не менялись."""
+    return quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+
+def budget_alerts_version(user_id):
+    return get_version(f"budget_alerts_version_{user_id}")
+
+
+def invalidate_budget_alerts(user_id):
+    bump_version(f"budget_alerts_version_{user_id}")
+
+
+def invalidate_budget_alerts_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate_budget_alerts(user_id))
+
+
+def invalidate_budget_alerts_for_deltas(deltas):
+    """
+    Инвалидирует кэш только тех пользователей, у кого запись изменила
+    траты текущего окна в категории с лимитом на этот период.
+    deltas — ключи (user, category, period, period_start) из aggregates.
+    """
+    starts = get_period_starts()
+    current = {
+        (user_id, category_id, period)
+        for user_id, category_id, period, period_start in deltas
+        if starts.get(period) == period_start
+    }
+    if not current:
+        return
+
+    budgeted = BudgetLimit.objects.filter(
+        user_id__in={key[0] for key in current},
+        category_id__in={key[1] for key in current},
+        period__in={key[2] for key in current},
+    ).values_list("user_id", "category_id", "period")
+    for user_id in {key[0] for key in budgeted if key in current}:
+        invalidate_budget_alerts_on_commit(user_id)
+
+
+def budget_cache_key(prefix, user_id):
+    return (
+        f"{prefix}_{user_id}_v{budget_alerts_version(user_id)}_"
+        f"{timezone.localdate().isoformat()}"
+    )
+
+
+def get_budget_alerts(user):
+    """check_budget_limits с кэшем до следующей значимой записи или смены дня."""
+    key = budget_cache_key("budget_alerts", user.id)
+    alerts = cache.get(key)
+    if alerts is not None:
+        incr_counter(BUDGET_ALERTS_HITS_KEY)
+        return alerts
+
+    incr_counter(BUDGET_ALERTS_MISSES_KEY)
+    alerts = check_budget_limits(user)
+    cache.set(key, alerts, timeout=seconds_until_tomorrow())
+    return alerts
+
+
+def get_budget_forecast(user):
+    """Прогноз по лимитам — инвалидируется теми же записями, что и оповещения."""
+    key = budget_cache_key("budget_forecast", user.id)
+    forecast = cache.get(key)
+    if forecast is None:
+        forecast = forecast_budgets(user)
+        cache.set(key, forecast, timeout=seconds_until_tomorrow())
+    return forecast
+
+
+def budget_alerts_cache_stats():
+    hits = cache.get(BUDGET_ALERTS_HITS_KEY) or 0
+    misses = cache.get(BUDGET_ALERTS_MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def get_redis_client():
+    """Клиент redis-py за кэшем по умолчанию или None для других бэкендов."""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        return backend._cache.get_client(write=True)
+    return None
+
+
+def stats_keys(user_id):
+    return (
+        cache.make_key(f"stats_hash_{user_id}"),
+        cache.make_key(f"stats_generation_{user_id}"),
+        cache.make_key(f"stats_pending_{user_id}"),
+    )
+
+
+def to_cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def patch_cached_statistics(rollup_deltas):
+    """Прибавляет дельты месячных сводок к hash статистики в Redis."""
+    client = get_redis_client()
+    if client is None:
+        return
+
+    fields = defaultdict(lambda: defaultdict(int))
+    for (user_id, month, type_, _), (amount, _) in rollup_deltas.items():
+        fields[user_id][f"{month:%Y-%m}:{type_}"] += to_cents(amount)
+
+    script = client.register_script(PATCH_STATS_SCRIPT)
+    for user_id, deltas in fields.items():
+        args = [STATS_VERSION, STATS_TTL]
+        for field, delta in deltas.items():
+            args.extend((field, delta))
+        script(keys=stats_keys(user_id), args=args)
+
+
+def patch_cached_statistics_on_commit(rollup_deltas):
+    """
+    Отмечает дельту сразу, а прибавляет её после коммита. Вызывать внутри
+    той же транзакции, что пишет MonthlyRollup, — отметка должна успеть
+    до коммита.
+    """
+    if not rollup_deltas:
+        return
+    client = get_redis_client()
+    if client is not None:
+        script = client.register_script(BEGIN_PATCH_STATS_SCRIPT)
+        for user_id in {key[0] for key in rollup_deltas}:
+            script(keys=stats_keys(user_id), args=[STATS_TTL, STATS_PENDING_TTL])
+    transaction.on_commit(lambda: patch_cached_statistics(rollup_deltas))
+
+
+def invalidate_statistics(user_id):
+    """
+    Удаляет hash статистики и поднимает поколение: заполнение, прочитавшее
+    MonthlyRollup раньше, не вернёт старые суммы.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    hash_key, generation_key, _ = stats_keys(user_id)
+    pipe = client.pipeline()
+    pipe.delete(hash_key)
+    pipe.incr(generation_key)
+    pipe.expire(generation_key, STATS_TTL)
+    pipe.execute()
+
+
+def invalidate_statistics_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate_statistics(user_id))
+
+
+def statistics_from_cents(cents):
+    """{"YYYY-MM:type": копейки} → данные для графиков статистики."""
+    months = sorted({field.split(":")[0] for field, value in cents.items() if value})
+    return {
+        "months": months,
+        "income": [cents.get(f"{m}:{Transaction.INCOME}", 0) / 100 for m in months],
+        "expense": [cents.get(f"{m}:{Transaction.EXPENSE}", 0) / 100 for m in months],
+    }
+
+
+def stats_lock_key(user_id):
+    return f"stats_refresh_lock_{user_id}"
+
+
+def refresh_statistics(user):
+    """Пересчитывает статистику из MonthlyRollup и кладёт её в hash Redis."""
+    client = get_redis_client()
+    if client is None:
+        return monthly_statistics(user)
+
+    keys = stats_keys(user.id)
+    generation = (client.get(keys[1]) or b"0").decode()
+    cents = {
+        f"{month:%Y-%m}:{type_}": to_cents(total)
+        for (month, type_), total in monthly_totals(user).items()
+    }
+    args = [
+        generation,
+        STATS_TTL,
+        "__version__",
+        STATS_VERSION,
+        "__fresh_until__",
+        int(time.time()) + STATS_FRESH_SECONDS,
+    ]
+    for field, value in cents.items():
+        args.extend((field, value))
+    client.register_script(FILL_STATS_SCRIPT)(keys=keys, args=args)
+    return statistics_from_cents(cents)
+
+
+def refresh_statistics_allowed(user_id):
+    """Явный ?refresh=true — не чаще раза в STATS_REFRESH_INTERVAL секунд."""
+    return cache.add(f"stats_refresh_rate_{user_id}", 1, STATS_REFRESH_INTERVAL)
+
+
+def get_statistics(user):
+    """
+    Помесячная статистика пользователя из hash в Redis.
+    Устаревшие данные отдаются сразу, обновление идёт в фоне.
+    Без Redis — напрямую из MonthlyRollup (один запрос, O(месяцев)).
+    """
+    client = get_redis_client()
+    if client is None:
+        return monthly_statistics(user)
+
+    raw = client.hgetall(stats_keys(user.id)[0])
+    if raw.pop(b"__version__", None) != STATS_VERSION.encode():
+        # Отдавать нечего — считаем сразу, это O(месяцев).
+        return refresh_statistics(user)
+
+    fresh_until = int(raw.pop(b"__fresh_until__", 0))
+    if fresh_until < time.time() and cache.add(
+        stats_lock_key(user.id), 1, STATS_LOCK_TIMEOUT
+    ):
+        from .tasks import refresh_statistics_task
+
+        refresh_statistics_task.delay(user.id)
+    return statistics_from_cents(
+        {field.decode(): int(value) for field, value in raw.items()}
+    )
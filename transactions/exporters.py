@@ -0,0 +1,275 @@
+"""
+Экспорт транзакций в CSV и NDJSON.
+
+Строки читаются через values_list кусками (на PostgreSQL — серверным
+курсором) и отдаются генератором: память не зависит от размера истории,
+а первые байты уходят клиенту сразу. Колонки совпадают с импортом, так что
+выгрузку можно загрузить обратно.
+
+На PostgreSQL CSV можно отдавать прямо из COPY ... TO STDOUT (режим
+CSV_EXPORT_MODE), без объектов Python на строку.
+
+Для очень больших историй есть ExportJob: Celery пишет gzip-файл пачками,
+а одинаковый запрос отдаёт готовый файл, пока версия данных пользователя
+(caching.data_version) не сменится.
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, CharField, F, Func, Q, TextField, Value, When
+from django.db.models.functions import NullIf
+from django.utils import timezone
+
+from .bulk import batched
+from .caching import data_version
+from .importers import IMPORT_COLUMNS
+from .jobs import claim_job, fail_stale_jobs, heartbeat, heartbeat_key
+from .models import ExportJob, Transaction
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = IMPORT_COLUMNS
+EXPORT_FIELDS = ("date", "amount", "type", "category__name", "description")
+EXPORT_FILTERS = ("type", "category", "date_from", "date_to")
+EXPORT_CHUNK_SIZE = 2000
+NDJSON_KEYS = tuple(column.lower() for column in EXPORT_COLUMNS)
+
+
+class Echo:
+    """Псевдофайл для csv.writer: writerow возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки CSV для транзакций queryset — без создания экземпляров моделей."""
+    types = dict(Transaction.TYPE_CHOICES)
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for date, amount, type_, category, description in rows:
+        yield date.isoformat(), amount, types[type_], category or "", description
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Текст CSV: заголовок сразу, дальше по chunk_size строк за раз."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for batch in batched(rows, chunk_size):
+        yield "".join(writer.writerow(row) for row in batch)
+
+
+def stream_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """NDJSON с теми же полями, что у CSV; сумма — строкой, без потери точности."""
+    for batch in batched(rows, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(NDJSON_KEYS, row)), default=str, ensure_ascii=False)
+            + "\n"
+            for row in batch
+        )
+
+
+# Быстрый путь PostgreSQL: COPY (SELECT ...) TO STDOUT отдаёт готовый CSV,
+# Python только пересылает байты. Колонки те же, что у export_rows.
+COPY_EXPORT_SQL = "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER {header})"
+COPY_EXPORT_CHUNK_SIZE = 50000
+
+
+def copy_export_supported():
+    return connection.vendor == "postgresql"
+
+
+def resolve_export_mode(mode=None):
+    """ "copy" — COPY TO на PostgreSQL, "orm" — csv.writer; "auto" выбирает сам."""
+    mode = mode or settings.CSV_EXPORT_MODE
+    if mode == "orm" or not copy_export_supported():
+        if mode == "copy":
+            logger.warning("COPY export needs PostgreSQL, falling back to ORM")
+        return "orm"
+    return "copy"
+
+
+def copy_export_query(queryset):
+    """SELECT с колонками экспорта; пустые строки — NULL, как у csv.writer."""
+    types = [
+        When(type=value, then=Value(label)) for value, label in Transaction.TYPE_CHOICES
+    ]
+    return queryset.values(
+        **{
+            "Date": Func(
+                F("date"),
+                Value("YYYY-MM-DD"),
+                function="to_char",
+                output_field=CharField(),
+            ),
+            "Amount": F("amount"),
+            "Type": Case(*types, output_field=CharField()),
+            "Category": NullIf(
+                F("category__name"), Value(""), output_field=CharField()
+            ),
+            "Description": NullIf(
+                F("description"), Value(""), output_field=TextField()
+            ),
+        }
+    )
+
+
+def copy_csv_chunks(queryset, chunk_size=COPY_EXPORT_CHUNK_SIZE):
+    """
+    Байты CSV из COPY ... TO STDOUT кусками по chunk_size строк.
+    Границы кусков — keyset по (date, id) в порядке -date, -id: каждый
+    кусок — отдельный COPY без OFFSET, в памяти не больше одного куска.
+    """
+    queryset = queryset.order_by("-date", "-id")
+    remaining, header = queryset, True
+    with connection.cursor() as cursor:
+        while True:
+            last = remaining.values_list("date", "id")[chunk_size - 1 : chunk_size]
+            last = next(iter(last), None)
+            chunk = remaining
+            if last is not None:
+                chunk = remaining.filter(
+                    Q(date__gt=last[0]) | Q(date=last[0], id__gte=last[1])
+                )
+            sql, params = copy_export_query(chunk).query.sql_with_params()
+            buffer = io.BytesIO()
+            cursor.copy_expert(
+                COPY_EXPORT_SQL.format(
+                    query=cursor.mogrify(sql, params).decode(),
+                    header="true" if header else "false",
+                ),
+                buffer,
+            )
+            yield buffer.getvalue()
+            if last is None:
+                return
+            remaining = remaining.filter(
+                Q(date__lt=last[0]) | Q(date=last[0], id__lt=last[1])
+            )
+            header = False
+
+
+EXPORT_WRITERS = {ExportJob.CSV: stream_csv, ExportJob.NDJSON: stream_ndjson}
+
+
+def counted(rows, counts):
+    for row in rows:
+        counts["rows"] += 1
+        yield row
+
+
+def export_filters(params):
+    """Фильтры списка из GET/POST — только заполненные и известные."""
+    return {key: params[key] for key in EXPORT_FILTERS if params.get(key)}
+
+
+def fail_stale_export_jobs(jobs=None):
+    """
+    Помечает зависшие выгрузки (без пульса дольше JOB_STALE_MINUTES)
+    упавшими, чтобы тот же запрос можно было повторить. Возвращает их число.
+    """
+    return fail_stale_jobs(ExportJob.objects.all() if jobs is None else jobs)
+
+
+def create_export_job(user, export_format, params):
+    """
+    Ставит выгрузку в очередь после коммита. Возвращает (задание, создано ли
+    новое): при тех же формате, фильтрах и данных отдаётся прежнее задание.
+    """
+    filters = export_filters(params)
+    params_hash = hashlib.md5(
+        json.dumps([export_format, filters], sort_keys=True).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    fail_stale_export_jobs(ExportJob.objects.filter(user=user, params_hash=params_hash))
+    existing = ExportJob.objects.filter(
+        user=user, params_hash=params_hash, data_version=data_version(user.pk)
+    ).exclude(status=ExportJob.FAILED)
+    if existing.exists():
+        return existing.get(), False
+
+    job = ExportJob(
+        user=user,
+        format=export_format,
+        filters=filters,
+        params_hash=params_hash,
+        data_version=data_version(user.pk),
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return existing.get(), False
+
+    from .tasks import export_transactions_task
+
+    transaction.on_commit(lambda: export_transactions_task.delay(job.pk))
+    return job, True
+
+
+def run_export_job(job_id, task_id=""):
+    """
+    Пишет gzip-файл выгрузки; повторный запуск живого задания ничего не
+    делает, зависшее (см. jobs) берётся заново. Пульс — после каждого куска.
+    """
+    job = claim_job(ExportJob, job_id, task_id)
+    if job is None:
+        return None
+
+    started = time.monotonic()
+    transactions = Transaction.objects.filtered(job.user, job.filters).order_by(
+        "-date", "-id"
+    )
+    counts = {"rows": 0}
+    try:
+        with tempfile.TemporaryFile() as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                rows = counted(export_rows(transactions), counts)
+                for chunk in EXPORT_WRITERS[job.format](rows):
+                    archive.write(chunk.encode())
+                    heartbeat(job)
+            file.seek(0)
+            job.file.save(job.download_name, File(file), save=False)
+    except Exception:
+        logger.exception("Export job %s failed", job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.FAILED, finished_at=timezone.now()
+        )
+        raise
+    finally:
+        cache.delete(heartbeat_key(job))
+
+    job.status = ExportJob.DONE
+    job.rows = counts["rows"]
+    job.duration = round(time.monotonic() - started, 3)
+    job.finished_at = timezone.now()
+    job.save()
+
+    # Выгрузки со старой версией данных больше не переиспользуются.
+    stale = (
+        ExportJob.objects.filter(user=job.user, status=ExportJob.DONE)
+        .exclude(data_version=data_version(job.user.pk))
+        .exclude(pk=job.pk)
+    )
+    for old in stale:
+        old.file.delete(save=False)
+        old.delete()
+
+    logger.info(
+        "Export %s for user=%s: %s rows in %ss",
+        job.format,
+        job.user.pk,
+        job.rows,
+        job.duration,
+    )
+    return {"rows": job.rows, "duration": job.duration}
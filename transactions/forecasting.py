@@ -0,0 +1,111 @@
+"""
+Прогноз расходов по бюджетам.
+
+Дневной ряд трат по категориям берётся из счётчиков DAY (SpendCounter),
+после чего все лимиты пользователя считаются разом матричными операциями
+NumPy: темп расходов, прогноз на конец периода и дата превышения лимита.
+"""
+
+import calendar
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import BudgetLimit, SpendCounter
+from .utils import annotate_budget_spend, get_period_starts
+
+
+def get_period_end(period, start):
+    if period == "DAY":
+        return start
+    if period == "WEEK":
+        return start + timedelta(days=6)
+    return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+
+
+def daily_spend_matrix(user, category_ids, first_day, today):
+    """Матрица трат категории × день за [first_day, today] из счётчиков DAY."""
+    rows = {category_id: index for index, category_id in enumerate(category_ids)}
+    matrix = np.zeros((len(rows), (today - first_day).days + 1))
+
+    counters = SpendCounter.objects.filter(
+        user=user,
+        period="DAY",
+        category_id__in=category_ids,
+        period_start__range=(first_day, today),
+    ).values_list("category_id", "period_start", "amount")
+    if counters:
+        category_ids, days, amounts = zip(*counters)
+        matrix[
+            [rows[category_id] for category_id in category_ids],
+            [(day - first_day).days for day in days],
+        ] = np.array(amounts, dtype=float)
+    return matrix
+
+
+def forecast_budgets(user, today=None):
+    """Прогноз по всем лимитам пользователя — без цикла по лимитам в расчёте."""
+    today = today or timezone.localdate()
+    budgets = list(
+        annotate_budget_spend(
+            BudgetLimit.objects.filter(user=user), get_period_starts(today)
+        ).order_by("pk")
+    )
+    if not budgets:
+        return []
+
+    first_day = min(budget.period_start for budget in budgets)
+    category_ids = sorted({budget.category_id for budget in budgets})
+    matrix = daily_spend_matrix(user, category_ids, first_day, today)
+    row_of = {category_id: index for index, category_id in enumerate(category_ids)}
+
+    ends = [get_period_end(budget.period, budget.period_start) for budget in budgets]
+    rows = np.array([row_of[budget.category_id] for budget in budgets])
+    offsets = np.array([(budget.period_start - first_day).days for budget in budgets])
+    limits = np.array([float(budget.limit_amount) for budget in budgets])
+    spent = np.array([float(budget.spent) for budget in budgets])
+    elapsed = np.array([(today - budget.period_start).days + 1 for budget in budgets])
+    lengths = np.array(
+        [(end - budget.period_start).days + 1 for budget, end in zip(budgets, ends)]
+    )
+
+    # Накопленные траты внутри окна каждого лимита (до начала окна — нули).
+    days = np.arange(matrix.shape[1])
+    in_window = days[None, :] >= offsets[:, None]
+    cumulative = np.cumsum(np.where(in_window, matrix[rows], 0.0), axis=1)
+
+    rate = spent / elapsed
+    projected = rate * lengths
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage = np.where(limits > 0, projected / limits * 100, 0.0)
+        days_to_limit = np.ceil((limits - spent) / rate)
+
+    # Дата превышения — смещение в днях от first_day, -1 если не ожидается.
+    today_offset = (today - first_day).days
+    end_offsets = offsets + lengths - 1
+    crossed = cumulative >= limits[:, None]
+    reached_on = np.where(crossed.any(axis=1), crossed.argmax(axis=1), today_offset)
+    expected_on = np.where(rate > 0, today_offset + days_to_limit, -1)
+    expected_on = np.where(expected_on <= end_offsets, expected_on, -1)
+    exceed_offsets = np.where(spent >= limits, reached_on, expected_on).astype(int)
+
+    return [
+        {
+            "id": budget.pk,
+            "category": budget.category_name,
+            "period": budget.get_period_display(),
+            "period_end": end.isoformat(),
+            "limit": float(limits[index]),
+            "spent": float(spent[index]),
+            "daily_rate": round(float(rate[index]), 2),
+            "projected": round(float(projected[index]), 2),
+            "projected_percentage": round(float(percentage[index]), 1),
+            "exceeds_on": (
+                (first_day + timedelta(days=int(exceed_offsets[index]))).isoformat()
+                if exceed_offsets[index] >= 0
+                else None
+            ),
+        }
+        for index, (budget, end) in enumerate(zip(budgets, ends))
+    ]
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
@@ -142,6 +143,7 @@ class CSVImportForm(forms.Form):
         file = self.cleaned_data["csv_file"]
         if not file.name.endswith(".csv"):
             raise forms.ValidationError("Only .csv files are allowed.")
-        if file.size > 5 * 1024 * 1024:  # 5MB
-            raise forms.ValidationError("File size must not exceed 5MB.")
+        max_size = settings.CSV_IMPORT_MAX_UPLOAD_MB
+        if file.size > max_size * 1024 * 1024:
+            raise forms.ValidationError(f"File size must not exceed {max_size}MB.")
         return file
@@ -0,0 +1,865 @@
+"""
+Импорт транзакций из CSV.
+
+Загрузка декодируется по мере чтения и разбирается построчно генератором,
+так что в памяти одновременно только одна пачка строк. На каждую пачку
+новые названия категорий разрешаются одним SELECT и одной вставкой с
+ON CONFLICT, а транзакции пишутся bulk_create; весь импорт идёт в одной
+транзакции БД. bulk_create не шлёт сигналы, поэтому агрегаты, кэш и
+проверка бюджета обновляются один раз в конце по накопленным дельтам.
+
+Из веба импорт идёт через ImportJob: загрузка сохраняется, обработка уходит
+в Celery, а прогресс пишется в кэш (сам импорт — одна транзакция БД, и её
+промежуточные записи другим соединениям не видны). Повторная загрузка того
+же файла по SHA-256 отдаёт уже существующее задание.
+
+Строки, отпечаток которых (Transaction.fingerprint) уже был у пользователя
+до начала импорта, пропускаются — так повторный импорт пересекающейся
+выписки ничего не удваивает.
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import multiprocessing
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Max, Q, Window
+from django.db.models.functions import FirstValue, RowNumber
+from django.utils import timezone
+
+from .aggregates import insert_deltas
+from .bulk import apply_bulk_effects, batched, delete_transactions, removal_state
+from .jobs import claim_job, fail_stale_jobs, heartbeat, heartbeat_key
+from .models import (
+    Category,
+    ImportJob,
+    Transaction,
+    User,
+    normalize_description,
+    transaction_fingerprint,
+)
+
+logger = logging.getLogger(__name__)
+
+IMPORT_COLUMNS = ("Date", "Amount", "Type", "Category", "Description")
+EXPECTED_FIELDS = set(IMPORT_COLUMNS)
+IMPORT_PROGRESS_TIMEOUT = 60 * 60 * 24
+CHECKS = ("date", "amount", "amount_positive", "amount_fits", "type", "category")
+
+_amount_field = Transaction._meta.get_field("amount")
+AMOUNT_LIMIT = 10 ** (_amount_field.max_digits - _amount_field.decimal_places)
+CATEGORY_MAX_LENGTH = Category._meta.get_field("name").max_length
+CENT = Decimal("0.01")
+IMPORT_ERROR_PREVIEW = 100
+
+
+def row_errors(line_num, row, checks):
+    """
+    Сообщения об ошибках строки по результатам проверок — одни и те же
+    для проверки в Python и в SQL (COPY).
+    """
+    errors = []
+    if not checks["date"]:
+        errors.append(
+            f"Row {line_num}: invalid date '{row['Date']}' (expected YYYY-MM-DD)"
+        )
+    if not checks["amount"]:
+        errors.append(f"Row {line_num}: invalid amount '{row['Amount']}'")
+    elif not checks["amount_positive"]:
+        errors.append(f"Row {line_num}: amount must be greater than zero")
+    elif not checks["amount_fits"]:
+        errors.append(f"Row {line_num}: amount must be less than {AMOUNT_LIMIT}")
+    if not checks["type"]:
+        errors.append(
+            f"Row {line_num}: invalid type '{row['Type']}' "
+            f"(expected 'income' or 'expense')"
+        )
+    if not checks["category"]:
+        errors.append(
+            f"Row {line_num}: category name is longer than "
+            f"{CATEGORY_MAX_LENGTH} characters"
+        )
+    return errors
+
+
+def raw_fields(row):
+    """Поля строки как в файле — для сообщений об ошибках в обоих режимах."""
+    return {column: row.get(column) or "" for column in IMPORT_COLUMNS}
+
+
+def clean_row(row):
+    """
+    Очищенные поля строки — одно определение для проверки в Python и для
+    staging-таблицы COPY. str.strip() убирает и неразрывные пробелы, тип
+    приводится к нижнему регистру.
+    """
+    fields = {column: (row.get(column) or "").strip() for column in IMPORT_COLUMNS}
+    fields["Type"] = fields["Type"].lower()
+    return fields
+
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_amount(text):
+    """Сумма, округлённая как round() в PostgreSQL, или None."""
+    try:
+        amount = Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+    return amount if amount.is_finite() else None
+
+
+def validate_row(line_num, row):
+    """Проверяет строку CSV. Возвращает (значения, ошибки)."""
+    fields = clean_row(row)
+    checks = dict.fromkeys(CHECKS, True)
+
+    date = parse_date(fields["Date"])
+    checks["date"] = date is not None
+    amount = parse_amount(fields["Amount"])
+    if amount is None:
+        checks["amount"] = False
+    else:
+        checks["amount_positive"] = amount > 0
+        checks["amount_fits"] = amount < AMOUNT_LIMIT
+    checks["type"] = fields["Type"] in [Transaction.INCOME, Transaction.EXPENSE]
+    checks["category"] = len(fields["Category"]) <= CATEGORY_MAX_LENGTH
+
+    # Проверяются очищенные значения, а в сообщениях — исходные.
+    errors = row_errors(line_num, raw_fields(row), checks)
+    if errors:
+        return None, errors
+    return {
+        "line_num": line_num,
+        "date": date,
+        "amount": amount,
+        "type": fields["Type"],
+        "category": fields["Category"],
+        "description": fields["Description"],
+    }, []
+
+
+def resolve_categories(user, names):
+    """{название: id} — один SELECT и одна вставка недостающих категорий."""
+    ids = dict(
+        Category.objects.filter(user=user, name__in=names).values_list("name", "id")
+    )
+    missing = [Category(user=user, name=name) for name in sorted(names - ids.keys())]
+    if missing:
+        # Конкурентный импорт мог создать ту же категорию: ON CONFLICT DO UPDATE
+        # вернёт id существующей строки вместо ошибки уникальности.
+        created = Category.objects.bulk_create(
+            missing,
+            update_conflicts=True,
+            unique_fields=["user", "name"],
+            update_fields=["name"],
+        )
+        ids.update((category.name, category.pk) for category in created)
+    return ids
+
+
+def read_csv(file):
+    """DictReader поверх загрузки, декодируемой потоково (utf-8-sig убирает BOM)."""
+    return csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+
+
+class ImportErrors:
+    """
+    Ошибки импорта: в памяти только первые limit сообщений, все остальные
+    сразу уходят в report (бинарный файл, пишется gzip-текст по строке на
+    ошибку). Без report лишние сообщения только считаются.
+    """
+
+    def __init__(self, report=None, limit=IMPORT_ERROR_PREVIEW):
+        self.preview = []
+        self.count = 0
+        self.limit = limit
+        self.file = report
+        self.report = None
+
+    def extend(self, messages):
+        for message in messages:
+            self.count += 1
+            if len(self.preview) < self.limit:
+                self.preview.append(message)
+            if self.file is not None:
+                if self.report is None:  # пустой отчёт не создаётся вовсе
+                    self.report = gzip.GzipFile(fileobj=self.file, mode="wb")
+                self.report.write(f"{message}\n".encode())
+
+    def close(self):
+        if self.report:
+            self.report.close()
+
+
+def validate_chunk(chunk):
+    """validate_row для куска [(номер строки, строка)] — выполняется в пуле."""
+    return [validate_row(line_num, row) for line_num, row in chunk]
+
+
+def resolve_import_workers(workers=None):
+    """
+    Число процессов для проверки строк (CSV_IMPORT_WORKERS); 1 — без пула.
+    Пулу нужен fork: дочерние процессы наследуют настроенный Django.
+
+    Воркеры Celery с пулом prefork (по умолчанию) — демоны, а демонам
+    multiprocessing не даёт заводить детей при любом способе запуска (spawn и
+    forkserver тоже). Там проверка идёт в текущем процессе; пул работает в
+    benchmark_import и в воркере с --pool=solo.
+    """
+    workers = workers or settings.CSV_IMPORT_WORKERS
+    if workers <= 1:
+        return 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("Parallel CSV validation needs fork, validating in-process")
+        return 1
+    if multiprocessing.current_process().daemon:
+        # Например, воркер Celery с пулом prefork: демонам нельзя иметь детей.
+        logger.warning("Daemon processes cannot start a pool, validating in-process")
+        return 1
+    return workers
+
+
+def validated_in_pool(numbered_rows, workers, chunk_size):
+    """
+    validate_row по кускам в пуле процессов, результаты — в исходном порядке.
+    В работе не больше 2 × workers кусков, так что файл не читается наперёд.
+    """
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = deque()
+        for chunk in batched(numbered_rows, chunk_size):
+            pending.append(pool.submit(validate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def valid_rows(reader, errors, counts, workers=1, chunk_size=1000):
+    """Генератор проверенных строк; ошибки складываются в errors."""
+    numbered_rows = enumerate(reader, start=2)  # строка 1 — заголовок
+    if workers > 1:
+        results = validated_in_pool(numbered_rows, workers, chunk_size)
+    else:
+        results = (validate_row(line_num, row) for line_num, row in numbered_rows)
+    for values, row_errors in results:
+        if row_errors:
+            errors.extend(row_errors)
+            counts["failed"] += 1
+        else:
+            yield values
+
+
+def write_rows(user, rows, batch_size, counts, on_batch=None, import_batch=""):
+    """
+    Пишет строки пачками; возвращает число созданных транзакций.
+    Строки, отпечаток которых уже есть у пользователя, пропускаются
+    (counts["skipped"]). on_batch(created) вызывается после каждой пачки.
+    """
+    category_ids = {}
+    spend, rollup = {}, {}
+    created = 0
+    has_expenses = False
+    # Сверяемся только со строками, которые были до импорта: одинаковые строки
+    # внутри одного файла (две одинаковые покупки за день) — не повтор.
+    last_id = Transaction.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    for batch in batched(rows, batch_size):
+        for row in batch:
+            row["fingerprint"] = transaction_fingerprint(
+                user.pk, row["date"], row["amount"], row["type"], row["description"]
+            )
+        existing = set(
+            Transaction.objects.filter(
+                user=user,
+                pk__lte=last_id,
+                fingerprint__in={row["fingerprint"] for row in batch},
+            ).values_list("fingerprint", flat=True)
+        )
+        fresh = [row for row in batch if row["fingerprint"] not in existing]
+        counts["skipped"] += len(batch) - len(fresh)
+        batch = fresh
+
+        names = {row["category"] for row in batch if row["category"]}
+        if names - category_ids.keys():
+            category_ids.update(resolve_categories(user, names - category_ids.keys()))
+        transactions = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user=user,
+                    date=row["date"],
+                    amount=row["amount"],
+                    type=row["type"],
+                    category_id=category_ids.get(row["category"]),
+                    description=row["description"],
+                    fingerprint=row["fingerprint"],
+                    import_batch=import_batch,
+                )
+                for row in batch
+            ]
+        )
+        insert_deltas(
+            (obj.get_ledger_state() for obj in transactions),
+            spend,
+            rollup,
+        )
+        has_expenses = has_expenses or any(
+            row["type"] == Transaction.EXPENSE for row in batch
+        )
+        created += len(transactions)
+        if on_batch:
+            on_batch(created)
+
+    if created:
+        apply_bulk_effects(user, spend, rollup, has_expenses)
+    return created
+
+
+# ─── COPY (PostgreSQL) ───────────────────────────────────────────────────────
+
+STAGING_COLUMNS = (
+    "line_num",
+    "date",
+    "amount",
+    "type",
+    "category",
+    "description",
+    "description_key",
+    "raw_date",
+    "raw_amount",
+    "raw_type",
+)
+
+CREATE_STAGING_SQL = """
+    CREATE TEMPORARY TABLE import_staging (
+        line_num integer, date text, amount text, type text,
+        category text, description text, description_key text,
+        raw_date text, raw_amount text, raw_type text
+    ) ON COMMIT DROP
+"""
+
+# FORCE_NOT_NULL: пустое поле — пустая строка, как в csv.DictReader, а не NULL.
+COPY_STAGING_SQL = f"""
+    COPY import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN
+    WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(STAGING_COLUMNS[1:])}))
+"""
+
+# Поля приходят уже очищенными (clean_row), дата и сумма — в каноническом
+# виде, если Python их разобрал. Поэтому SQL лишь повторяет вердикт
+# validate_row: строгий формат пропускает ровно то, что разобрал Python.
+# pg_input_is_valid (PostgreSQL 16+) проверяет дату без исключения.
+CHECK_STAGING_SQL = r"""
+    CREATE TEMPORARY TABLE import_checked ON COMMIT DROP AS
+    SELECT s.line_num, s.raw_date, s.raw_amount, s.raw_type,
+           c.date_ok, c.amount_ok,
+           c.amount_ok AND v.amount_value > 0 AS amount_positive,
+           c.amount_ok AND v.amount_value < %(amount_limit)s AS amount_fits,
+           s.type IN ('income', 'expense') AS type_ok,
+           char_length(s.category) <= %(category_max)s AS category_ok,
+           s.type AS type_value, s.category AS category_value,
+           s.description AS description_value,
+           v.date_value, v.amount_value,
+           -- Тот же формат, что у models.transaction_fingerprint.
+           encode(sha256(convert_to(concat_ws('|',
+               %(user_id)s::text, to_char(v.date_value, 'YYYY-MM-DD'),
+               v.amount_value::text, s.type, s.description_key
+           ), 'UTF8')), 'hex') AS fingerprint
+    FROM import_staging s,
+    LATERAL (
+        SELECT s.date ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$'
+                   AND pg_input_is_valid(s.date, 'date') AS date_ok,
+               s.amount ~ '^-?[0-9]+\.[0-9]{2}$' AS amount_ok
+    ) c,
+    LATERAL (
+        SELECT CASE WHEN c.date_ok THEN s.date::date END AS date_value,
+               CASE WHEN c.amount_ok THEN s.amount::numeric END
+                   AS amount_value
+    ) v
+"""
+
+VALID_SQL = "amount_positive AND amount_fits AND date_ok AND type_ok AND category_ok"
+
+STAGING_ERRORS_SQL = f"""
+    SELECT line_num, raw_date, raw_amount, raw_type,
+           date_ok, amount_ok, amount_positive, amount_fits, type_ok, category_ok
+    FROM import_checked
+    WHERE NOT ({VALID_SQL})
+    ORDER BY line_num
+"""
+
+STAGING_VALID_COUNT_SQL = f"SELECT count(*) FROM import_checked WHERE {VALID_SQL}"
+
+# Строки, которые будут вставлены: валидные и ещё не загруженные. Снимок
+# запроса не видит собственных вставок, так что одинаковые строки одного
+# файла друг друга не отсекают.
+NEW_ROWS_SQL = f"""
+    {VALID_SQL}
+    AND NOT EXISTS (
+        SELECT 1 FROM {{transaction_table}} t
+        WHERE t.user_id = %(user_id)s AND t.fingerprint = k.fingerprint
+    )
+"""
+
+# Категории создаются только для строк, которые действительно вставятся.
+STAGING_CATEGORIES_SQL = f"""
+    INSERT INTO {{category_table}} (name, user_id)
+    SELECT DISTINCT k.category_value, %(user_id)s
+    FROM import_checked k
+    WHERE {NEW_ROWS_SQL} AND k.category_value <> ''
+    ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+# Вставка и дельты агрегатов одним запросом: сгруппированы по дню,
+# так что в Python приходит O(дней × категорий), а не O(строк).
+STAGING_INSERT_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO {{transaction_table}}
+            (user_id, amount, date, type, category_id, description, fingerprint,
+             import_batch)
+        SELECT %(user_id)s, k.amount_value, k.date_value, k.type_value,
+               c.id, k.description_value, k.fingerprint, %(import_batch)s
+        FROM import_checked k
+        LEFT JOIN {{category_table}} c
+            ON c.user_id = %(user_id)s
+            AND c.name = k.category_value
+            AND k.category_value <> ''
+        WHERE {NEW_ROWS_SQL}
+        ORDER BY k.line_num
+        RETURNING category_id, type, date, amount
+    )
+    SELECT category_id, type, date, SUM(amount), COUNT(*)
+    FROM inserted
+    GROUP BY category_id, type, date
+"""
+
+
+def copy_import_supported():
+    return connection.vendor == "postgresql" and connection.pg_version >= 160000
+
+
+def resolve_import_mode(mode=None):
+    """
+    "copy" — COPY в staging-таблицу и SQL над множеством строк (PostgreSQL 16+),
+    "orm" — bulk_create. "auto" выбирает COPY, где он доступен.
+    """
+    mode = mode or settings.CSV_IMPORT_MODE
+    if mode == "orm" or not copy_import_supported():
+        if mode == "copy":
+            logger.warning("COPY import needs PostgreSQL 16+, falling back to ORM")
+        return "orm"
+    return "copy"
+
+
+def staging_row(line_num, row):
+    """
+    Строка для staging-таблицы: поля после clean_row, дата и сумма —
+    в каноническом виде, если разбираются (иначе как есть, и SQL их отвергнет).
+    Исходные дата, сумма и тип идут отдельно — для сообщений об ошибках.
+    """
+    fields, raw = clean_row(row), raw_fields(row)
+    date = parse_date(fields["Date"])
+    amount = parse_amount(fields["Amount"])
+    return (
+        line_num,
+        fields["Date"] if date is None else date.isoformat(),
+        fields["Amount"] if amount is None else str(amount),
+        fields["Type"],
+        fields["Category"],
+        fields["Description"],
+        normalize_description(fields["Description"]),
+        raw["Date"],
+        raw["Amount"],
+        raw["Type"],
+    )
+
+
+def staging_batches(reader, batch_size):
+    """Очищенные строки CSV пачками в формате CSV для COPY FROM STDIN."""
+    rows = (staging_row(line_num, row) for line_num, row in enumerate(reader, start=2))
+    for batch in batched(rows, batch_size):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(batch)
+        buffer.seek(0)
+        yield len(batch), buffer
+
+
+def copy_rows(user, reader, batch_size, errors, counts, on_batch=None, import_batch=""):
+    """
+    Импорт через COPY: сырые строки потоково идут в staging-таблицу,
+    проверка, категории и вставка — по одному SQL-запросу на весь файл.
+    Возвращает число созданных транзакций.
+    """
+    tables = {
+        "category_table": Category._meta.db_table,
+        "transaction_table": Transaction._meta.db_table,
+    }
+    params = {
+        "user_id": user.pk,
+        "amount_limit": AMOUNT_LIMIT,
+        "category_max": CATEGORY_MAX_LENGTH,
+        "import_batch": import_batch,
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DROP TABLE IF EXISTS pg_temp.import_staging, pg_temp.import_checked"
+        )
+        cursor.execute(CREATE_STAGING_SQL)
+        staged = 0
+        for size, buffer in staging_batches(reader, batch_size):
+            cursor.copy_expert(COPY_STAGING_SQL, buffer)
+            staged += size
+            if on_batch:
+                on_batch(staged)  # до вставки прогресс считается по принятым строкам
+
+        cursor.execute(CHECK_STAGING_SQL, params)
+        cursor.execute(STAGING_ERRORS_SQL)
+        for line_num, date, amount, type_, *flags in cursor:
+            row = {"Date": date, "Amount": amount, "Type": type_}
+            errors.extend(row_errors(line_num, row, dict(zip(CHECKS, flags))))
+            counts["failed"] += 1
+
+        cursor.execute(STAGING_VALID_COUNT_SQL)
+        valid = cursor.fetchone()[0]
+        cursor.execute(STAGING_CATEGORIES_SQL.format(**tables), params)
+        cursor.execute(STAGING_INSERT_SQL.format(**tables), params)
+        states = [
+            {
+                "user_id": user.pk,
+                "category_id": category_id,
+                "type": type_,
+                "date": date,
+                "amount": amount,
+                "count": count,
+            }
+            for category_id, type_, date, amount, count in cursor.fetchall()
+        ]
+
+    created = sum(state["count"] for state in states)
+    counts["skipped"] += valid - created
+    if created:
+        spend, rollup = insert_deltas(states)
+        apply_bulk_effects(
+            user,
+            spend,
+            rollup,
+            any(state["type"] == Transaction.EXPENSE for state in states),
+        )
+    return created
+
+
+def import_transactions_from_csv(
+    file,
+    user,
+    batch_size=None,
+    progress=None,
+    mode=None,
+    workers=None,
+    error_report=None,
+):
+    """
+    Парсит CSV файл и создаёт транзакции для пользователя.
+    Возвращает словарь: created, failed (строк с ошибками), skipped (уже
+    загруженных), errors (первые IMPORT_ERROR_PREVIEW), error_count, duration,
+    rows_per_second, mode. Все ошибки пишутся gzip-текстом в error_report,
+    если он передан.
+    progress(created, failed, skipped, bytes_read) вызывается после каждой
+    пачки. mode — "copy", "orm" или "auto" (CSV_IMPORT_MODE). workers — число
+    процессов для проверки строк в режиме ORM (CSV_IMPORT_WORKERS).
+    Ожидаемые колонки: Date, Amount, Type, Category, Description
+    """
+    started = time.monotonic()
+    batch_size = batch_size or settings.CSV_IMPORT_BATCH_SIZE
+    mode = resolve_import_mode(mode)
+    workers = resolve_import_workers(workers) if mode == "orm" else 1
+    errors = ImportErrors(error_report)
+    counts = {"failed": 0, "skipped": 0}
+    import_batch = uuid.uuid4().hex
+
+    def on_batch(created):
+        if progress:
+            progress(created, counts["failed"], counts["skipped"], file.tell())
+
+    try:
+        reader = read_csv(file)
+        if not reader.fieldnames or not EXPECTED_FIELDS.issubset(reader.fieldnames):
+            missing = EXPECTED_FIELDS - set(reader.fieldnames or [])
+            return {
+                "created": 0,
+                "errors": [f"Missing required columns: {', '.join(missing)}"],
+                "error_count": 1,
+            }
+        # Ошибка кодировки может всплыть посреди файла — тогда откатываем всё.
+        with transaction.atomic():
+            if mode == "copy":
+                created = copy_rows(
+                    user, reader, batch_size, errors, counts, on_batch, import_batch
+                )
+            else:
+                created = write_rows(
+                    user,
+                    valid_rows(reader, errors, counts, workers, batch_size),
+                    batch_size,
+                    counts,
+                    on_batch,
+                    import_batch,
+                )
+    except UnicodeDecodeError:
+        return {
+            "created": 0,
+            "errors": ["File encoding error. Please use UTF-8."],
+            "error_count": 1,
+        }
+    finally:
+        errors.close()
+
+    duration = time.monotonic() - started
+    result = {
+        "created": created,
+        "failed": counts["failed"],
+        "skipped": counts["skipped"],
+        "errors": errors.preview,
+        "error_count": errors.count,
+        "duration": round(duration, 3),
+        "rows_per_second": round(created / duration, 1) if duration else None,
+        "mode": mode,
+        "workers": workers,
+    }
+    logger.info(
+        "CSV import (%s) for user=%s: %s rows, %s skipped, %s errors in %ss "
+        "(%s rows/s)",
+        mode,
+        user.pk,
+        result["created"],
+        result["skipped"],
+        errors.count,
+        result["duration"],
+        result["rows_per_second"],
+    )
+    return result
+
+
+def collapse_duplicate_transactions(
+    user_ids=None, batch_size=1000, dry_run=True, include_same_batch=False
+):
+    """
+    Удаляет повторы среди транзакций с одинаковым отпечатком. Остаётся пачка
+    импорта самой ранней из них; строки той же пачки (две одинаковые
+    покупки в одном файле) и созданные вручную друг с другом не сравниваются,
+    если не задан include_same_batch — тогда остаётся одна самая ранняя.
+    Удаление идёт пачками без сигналов, агрегаты уменьшаются накопленными
+    дельтами. По умолчанию только считает. Возвращает число удалённых
+    (при dry_run — найденных) транзакций.
+    """
+    transactions = Transaction.objects.exclude(fingerprint="")
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=user_ids)
+    group = {
+        "partition_by": [F("user_id"), F("fingerprint")],
+        "order_by": F("id").asc(),
+    }
+    duplicates = transactions.annotate(
+        rank=Window(RowNumber(), **group),
+        first_batch=Window(FirstValue("import_batch"), **group),
+    ).filter(rank__gt=1)
+    if not include_same_batch:
+        duplicates = duplicates.filter(~Q(import_batch=F("first_batch")))
+    duplicates = list(
+        duplicates.order_by("id").values("id", *Transaction.LEDGER_FIELDS)
+    )
+    if dry_run or not duplicates:
+        return len(duplicates)
+
+    by_user = {}
+    for row in duplicates:
+        by_user.setdefault(row["user_id"], []).append(row)
+    users = User.objects.in_bulk(by_user)
+
+    with transaction.atomic():
+        delete_transactions([row["id"] for row in duplicates], batch_size)
+        for user_id, rows in by_user.items():
+            spend, rollup = insert_deltas(removal_state(row) for row in rows)
+            apply_bulk_effects(
+                users[user_id],
+                spend,
+                rollup,
+                any(row["type"] == Transaction.EXPENSE for row in rows),
+            )
+    logger.info(
+        "Collapsed %s duplicate transaction(s) for %s user(s)",
+        len(duplicates),
+        len(by_user),
+    )
+    return len(duplicates)
+
+
+def file_sha256(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def active_import_jobs(user, file_hash):
+    return ImportJob.objects.filter(user=user, file_hash=file_hash).exclude(
+        status=ImportJob.FAILED
+    )
+
+
+def fail_stale_import_jobs(jobs=None):
+    """
+    Помечает зависшие задания (без пульса дольше JOB_STALE_MINUTES)
+    упавшими, чтобы файл можно было загрузить снова. Возвращает их число.
+    """
+    return fail_stale_jobs(
+        ImportJob.objects.all() if jobs is None else jobs,
+        errors=["Import was interrupted. Please upload the file again."],
+        error_count=1,
+    )
+
+
+def create_import_job(user, upload):
+    """
+    Сохраняет загрузку и ставит импорт в очередь после коммита.
+    Возвращает (задание, создано ли новое): тот же файл второй раз не
+    обрабатывается, вместо этого отдаётся прежнее задание.
+    """
+    file_hash = file_sha256(upload)
+    fail_stale_import_jobs(ImportJob.objects.filter(user=user, file_hash=file_hash))
+    existing = active_import_jobs(user, file_hash).first()
+    if existing:
+        return existing, False
+
+    job = ImportJob(
+        user=user,
+        file=upload,
+        file_name=upload.name,
+        file_hash=file_hash,
+        file_size=upload.size,
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # Тот же файл загрузили параллельно — сохранённая копия не нужна.
+        job.file.delete(save=False)
+        return active_import_jobs(user, file_hash).get(), False
+
+    from .tasks import import_csv_task
+
+    transaction.on_commit(lambda: import_csv_task.delay(job.pk))
+    return job, True
+
+
+def import_progress_key(job_id):
+    return f"import_job_progress_{job_id}"
+
+
+def run_import_job(job_id, task_id=""):
+    """
+    Выполняет задание; повторный запуск живого задания ничего не делает.
+    Зависшее задание (см. jobs) берётся заново. Пульс обновляется вместе
+    с прогрессом после каждой пачки.
+    """
+    job = claim_job(ImportJob, job_id, task_id)
+    if job is None:
+        return None
+
+    def progress(created, failed, skipped, bytes_read):
+        heartbeat(job)
+        cache.set(
+            import_progress_key(job.pk),
+            {
+                "created": created,
+                "failed": failed,
+                "skipped": skipped,
+                "bytes_read": bytes_read,
+            },
+            IMPORT_PROGRESS_TIMEOUT,
+        )
+
+    try:
+        with job.file.open("rb") as file, tempfile.TemporaryFile() as report:
+            result = import_transactions_from_csv(
+                file, job.user, progress=progress, error_report=report
+            )
+            if report.tell():
+                report.seek(0)
+                name = f"{Path(job.file_name).stem}-errors.txt.gz"
+                job.error_report.save(name, File(report), save=False)
+    except Exception:
+        logger.exception("Import job %s failed", job.pk)
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.FAILED,
+            finished_at=timezone.now(),
+            errors=["Import failed unexpectedly. Please try again."],
+            error_count=1,
+        )
+        raise
+    finally:
+        cache.delete_many([import_progress_key(job.pk), heartbeat_key(job)])
+
+    # Данные уже в базе, а дубликаты отсекаются по хешу — файл больше не нужен.
+    job.file.delete(save=False)
+    job.status = ImportJob.DONE
+    job.rows_created = result["created"]
+    job.rows_failed = result.get("failed", 0)
+    job.rows_skipped = result.get("skipped", 0)
+    job.errors = result["errors"]
+    job.error_count = result.get("error_count", len(result["errors"]))
+    job.finished_at = timezone.now()
+    job.save()
+    return result
+
+
+def import_job_status(job):
+    """Статус задания для страницы и JSON: строки, пропуски, ошибки, процент и ETA."""
+    created, failed, skipped = job.rows_created, job.rows_failed, job.rows_skipped
+    percent, eta = (100, 0) if job.is_finished else (0, None)
+
+    progress = cache.get(import_progress_key(job.pk))
+    if job.status == ImportJob.RUNNING and progress:
+        created, failed = progress["created"], progress["failed"]
+        skipped = progress.get("skipped", 0)
+        if job.file_size and progress["bytes_read"]:
+            done = min(progress["bytes_read"] / job.file_size, 1)
+            elapsed = (timezone.now() - job.started_at).total_seconds()
+            percent = round(done * 100, 1)
+            eta = round(elapsed * (1 - done) / done)
+
+    return {
+        "id": job.pk,
+        "file_name": job.file_name,
+        "status": job.status,
+        "rows_processed": created + failed + skipped,
+        "rows_created": created,
+        "rows_failed": failed,
+        "rows_skipped": skipped,
+        "percent": percent,
+        "eta_seconds": eta,
+        "errors": job.errors,
+        "error_count": job.error_count,
+        "error_report_url": job.error_report_url,
+        "finished": job.is_finished,
+    }
@@ -0,0 +1,96 @@
+"""
+Жизненный цикл фоновых заданий (ImportJob, ExportJob).
+
+Задание в RUNNING живо, пока воркер обновляет пульс (heartbeat). Пульс
+хранится в кэше, а не в строке задания: импорт идёт одной транзакцией БД,
+и её записи другим соединениям до коммита не видны. Задание без пульса
+дольше JOB_STALE_MINUTES считается прерванным — его забирает повторно
+доставленная задача или плановая уборка помечает упавшим.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_TIMEOUT = 60 * 60 * 24
+
+
+def heartbeat_key(job):
+    return f"{job._meta.model_name}_heartbeat_{job.pk}"
+
+
+def heartbeat(job):
+    cache.set(heartbeat_key(job), time.time(), HEARTBEAT_TIMEOUT)
+
+
+def last_heartbeat(job):
+    """Время последнего признака жизни: пульс или старт задания."""
+    started = job.started_at.timestamp() if job.started_at else 0
+    return max(cache.get(heartbeat_key(job)) or 0, started)
+
+
+def stale_seconds():
+    return settings.JOB_STALE_MINUTES * 60
+
+
+def is_stale(job):
+    return (
+        job.status == job.RUNNING
+        and time.time() - last_heartbeat(job) > stale_seconds()
+    )
+
+
+def claim_job(model, job_id, task_id=""):
+    """
+    Переводит задание в RUNNING, если оно ждёт запуска или зависло.
+    Условный UPDATE по прежним статусу и времени старта: из двух
+    претендентов задание достаётся одному. Возвращает задание или None.
+    """
+    job = model.objects.filter(pk=job_id).first()
+    if job is None or not (job.status == model.PENDING or is_stale(job)):
+        return None
+    claimed = model.objects.filter(
+        pk=job.pk, status=job.status, started_at=job.started_at
+    ).update(status=model.RUNNING, started_at=timezone.now(), task_id=task_id or "")
+    if not claimed:
+        return None
+    if job.status == model.RUNNING:
+        logger.warning("Reclaimed stale %s %s", model._meta.verbose_name, job.pk)
+    return model.objects.select_related("user").get(pk=job.pk)
+
+
+def reclaim_delay(model, job_id, task_id):
+    """
+    Через сколько секунд повторно доставленная задача сможет забрать своё
+    задание, если пульс не возобновится; None — ждать нечего (задание
+    завершено или принадлежит другой задаче).
+    """
+    if not task_id:
+        return None
+    job = model.objects.filter(pk=job_id, status=model.RUNNING, task_id=task_id).first()
+    if job is None:
+        return None
+    return max(int(last_heartbeat(job) + stale_seconds() - time.time()) + 1, 1)
+
+
+def fail_stale_jobs(jobs, **fields):
+    """Помечает зависшие задания из jobs упавшими. Возвращает их число."""
+    model = jobs.model
+    started_before = timezone.now() - timedelta(seconds=stale_seconds())
+    failed = 0
+    for job in jobs.filter(status=model.RUNNING, started_at__lt=started_before):
+        if is_stale(job):
+            failed += model.objects.filter(
+                pk=job.pk, status=model.RUNNING, started_at=job.started_at
+            ).update(status=model.FAILED, finished_at=timezone.now(), **fields)
+    if failed:
+        logger.warning(
+            "Marked %s stale %s(s) as failed", failed, model._meta.verbose_name
+        )
+    return failed
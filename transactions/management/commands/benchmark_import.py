@@ -0,0 +1,76 @@
+import random
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transactions.importers import copy_import_supported, import_transactions_from_csv
+
+
+def synthetic_csv(rows, categories, seed=42):
+    """Временный CSV со случайными транзакциями; ~1% строк с ошибками."""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=3 * 365)
+    file = tempfile.TemporaryFile()
+    file.write(b"Date,Amount,Type,Category,Description\n")
+    for index in range(rows):
+        day = start + timedelta(days=rng.randrange(3 * 365))
+        amount = f"{rng.uniform(1, 500):.2f}" if rng.random() > 0.01 else "oops"
+        type_ = "income" if rng.random() < 0.1 else "expense"
+        category = f"Category {rng.randrange(categories)}"
+        file.write(f"{day},{amount},{type_},{category},Row {index}\n".encode())
+    file.seek(0)
+    return file
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare CSV import throughput of the ORM (bulk_create) and COPY modes "
+        "on synthetic data. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--mode", choices=["orm", "copy", "both"], default="both")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Validation processes for the ORM mode (CSV_IMPORT_WORKERS).",
+        )
+
+    def handle(self, *args, **options):
+        modes = ["orm", "copy"] if options["mode"] == "both" else [options["mode"]]
+        for mode in modes:
+            if mode == "copy" and not copy_import_supported():
+                self.stdout.write(
+                    self.style.WARNING("copy: skipped, needs PostgreSQL 16+")
+                )
+                continue
+            result = self.run_import(mode, options)
+            self.stdout.write(
+                f"{mode} (workers={result['workers']}): {result['created']} rows, "
+                f"{result['failed']} failed in {result['duration']}s "
+                f"({result['rows_per_second']} rows/s)"
+            )
+
+    def run_import(self, mode, options):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                username=f"import-benchmark-{uuid.uuid4().hex[:12]}"
+            )
+            with synthetic_csv(options["rows"], options["categories"]) as file:
+                result = import_transactions_from_csv(
+                    file,
+                    user,
+                    batch_size=options["batch_size"],
+                    mode=mode,
+                    workers=options["workers"],
+                )
+            transaction.set_rollback(True)
+        return result
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from transactions.caching import budget_alerts_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the budget alerts cache."
+
+    def handle(self, *args, **options):
+        stats = budget_alerts_cache_stats()
+        hit_rate = "n/a" if stats["hit_rate"] is None else f"{stats['hit_rate']:.2%}"
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={hit_rate}"
+        )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from transactions.importers import collapse_duplicate_transactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Find duplicate transactions (same user, date, amount, type and "
+        "description) that come from a later CSV import than the earliest one. "
+        "Only counts them unless --apply is given; deleting keeps the earliest "
+        "import batch and updates the aggregates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Collapse only for this user id (repeatable).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Delete the duplicates instead of only counting them.",
+        )
+        parser.add_argument(
+            "--include-same-batch",
+            action="store_true",
+            help=(
+                "Also collapse duplicates within one import and between manually "
+                "created or pre-existing transactions, keeping only the earliest. "
+                "These are often real repeated purchases."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        count = collapse_duplicate_transactions(
+            user_ids=options["user_ids"],
+            batch_size=options["batch_size"],
+            dry_run=not options["apply"],
+            include_same_batch=options["include_same_batch"],
+        )
+        if options["apply"]:
+            self.stdout.write(
+                self.style.SUCCESS(f"Deleted {count} duplicate transaction(s).")
+            )
+        else:
+            self.stdout.write(
+                f"Found {count} duplicate transaction(s). Run with --apply to delete."
+            )
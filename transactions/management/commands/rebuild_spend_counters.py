@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from transactions.aggregates import rebuild_spend_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute budget spend counters from transactions (drift repair)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Rebuild only for this user id (repeatable).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild_spend_counters(
+            user_ids=options["user_ids"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} spend counter(s)."))
@@ -15,3 +15,24 @@ class TransactionManager(models.Manager):
 
     def expenses(self, user):
         return self.filter(user=user, type=self.model.EXPENSE)
+
+    def filtered(self, user, params):
+        """Транзакции пользователя с фильтрами списка: type, category, даты."""
+        queryset = self.filter(user=user)
+
+        transaction_type = params.get("type")
+        if transaction_type in [self.model.INCOME, self.model.EXPENSE]:
+            queryset = queryset.filter(type=transaction_type)
+
+        category_id = params.get("category")
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+
+        date_from = params.get("date_from")
+        date_to = params.get("date_to")
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+
+        return queryset
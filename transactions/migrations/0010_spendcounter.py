@@ -0,0 +1,108 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+
+def fill_spend_counters(apps, schema_editor):
+    Transaction = apps.get_model("transactions", "Transaction")
+    SpendCounter = apps.get_model("transactions", "SpendCounter")
+
+    expenses = Transaction.objects.filter(type="expense", category__isnull=False)
+    for period, trunc in (("DAY", TruncDay), ("WEEK", TruncWeek), ("MONTH", TruncMonth)):
+        rows = (
+            expenses.annotate(period_start=trunc("date"))
+            .values("user_id", "category_id", "period_start")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+        SpendCounter.objects.bulk_create(
+            (
+                SpendCounter(
+                    user_id=row["user_id"],
+                    category_id=row["category_id"],
+                    period=period,
+                    period_start=row["period_start"],
+                    amount=row["total"],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0009_alter_budgetlimit_unique_together_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpendCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("DAY", "Daily"),
+                            ("WEEK", "Weekly"),
+                            ("MONTH", "Monthly"),
+                        ],
+                        max_length=10,
+                        verbose_name="Period",
+                    ),
+                ),
+                ("period_start", models.DateField(verbose_name="Period Start")),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Amount",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="transactions.category",
+                        verbose_name="Category",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Spend Counter",
+                "verbose_name_plural": "Spend Counters",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "category", "period", "period_start"),
+                        name="unique_spend_counter",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_spend_counters, migrations.RunPython.noop),
+    ]
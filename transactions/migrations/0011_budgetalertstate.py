@@ -0,0 +1,99 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0010_spendcounter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BudgetAlertState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period_start", models.DateField(verbose_name="Period Start")),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("ok", "OK"),
+                            ("warning", "Warning"),
+                            ("exceeded", "Exceeded"),
+                        ],
+                        default="ok",
+                        max_length=10,
+                        verbose_name="State",
+                    ),
+                ),
+                (
+                    "spent",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="Spent"
+                    ),
+                ),
+                (
+                    "notified_state",
+                    models.CharField(
+                        choices=[
+                            ("ok", "OK"),
+                            ("warning", "Warning"),
+                            ("exceeded", "Exceeded"),
+                        ],
+                        default="ok",
+                        max_length=10,
+                        verbose_name="Highest Notified State",
+                    ),
+                ),
+                (
+                    "notify_pending",
+                    models.BooleanField(default=False, verbose_name="Pending"),
+                ),
+                (
+                    "notified_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Sent At"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+                (
+                    "budget",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alert_states",
+                        to="transactions.budgetlimit",
+                        verbose_name="Budget Limit",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Budget Alert State",
+                "verbose_name_plural": "Budget Alert States",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("notify_pending", True)),
+                        fields=["notify_pending"],
+                        name="alert_state_pending_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("budget", "period_start"),
+                        name="unique_budget_alert_state",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_monthly_rollups(apps, schema_editor):
+    Transaction = apps.get_model("transactions", "Transaction")
+    MonthlyRollup = apps.get_model("transactions", "MonthlyRollup")
+
+    rows = (
+        Transaction.objects.annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "type", "category_id")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    MonthlyRollup.objects.bulk_create(
+        (MonthlyRollup(**row) for row in rows.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0011_budgetalertstate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Month")),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("income", "Income"), ("expense", "Expense")],
+                        max_length=7,
+                        verbose_name="Type",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="Total"
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Count")),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="transactions.category",
+                        verbose_name="Category",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Monthly Rollup",
+                "verbose_name_plural": "Monthly Rollups",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "month"], name="transaction_user_id_deed3f_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "month", "type", "category"),
+                        name="unique_monthly_rollup",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_monthly_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0012_monthlyrollup"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(upload_to="imports/%Y/%m/", verbose_name="File"),
+                ),
+                (
+                    "file_name",
+                    models.CharField(max_length=255, verbose_name="File Name"),
+                ),
+                ("file_hash", models.CharField(max_length=64, verbose_name="SHA-256")),
+                ("file_size", models.BigIntegerField(default=0, verbose_name="Size")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "rows_created",
+                    models.IntegerField(default=0, verbose_name="Rows Created"),
+                ),
+                (
+                    "rows_failed",
+                    models.IntegerField(default=0, verbose_name="Rows Failed"),
+                ),
+                (
+                    "errors",
+                    models.JSONField(blank=True, default=list, verbose_name="Errors"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Started"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Finished"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Import Job",
+                "verbose_name_plural": "Import Jobs",
+                "ordering": ["-created_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status", "failed"), _negated=True),
+                        fields=("user", "file_hash"),
+                        name="unique_import_file",
+                    )
+                ],
+            },
+        ),
+    ]
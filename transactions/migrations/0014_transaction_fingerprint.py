@@ -0,0 +1,67 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:25
+
+import hashlib
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def transaction_fingerprint(user_id, date, amount, type_, description):
+    # Копия models.transaction_fingerprint на момент миграции: историческая
+    # миграция не должна меняться вместе с живым кодом.
+    amount = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    description = " ".join(description.split()).casefold()
+    key = f"{user_id}|{date}|{amount}|{type_}|{description}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    batch = []
+    for transaction in Transaction.objects.only(
+        "user_id", "date", "amount", "type", "description"
+    ).iterator(chunk_size=2000):
+        transaction.fingerprint = transaction_fingerprint(
+            transaction.user_id,
+            transaction.date,
+            transaction.amount,
+            transaction.type,
+            transaction.description,
+        )
+        batch.append(transaction)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+    Transaction.objects.bulk_update(batch, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0013_importjob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="rows_skipped",
+            field=models.IntegerField(default=0, verbose_name="Rows Skipped"),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, verbose_name="Fingerprint"
+            ),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "fingerprint"], name="transaction_user_id_3ec235_idx"
+            ),
+        ),
+    ]
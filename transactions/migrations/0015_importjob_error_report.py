@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0014_transaction_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="error_count",
+            field=models.IntegerField(default=0, verbose_name="Error Count"),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="error_report",
+            field=models.FileField(
+                blank=True,
+                upload_to="imports/errors/%Y/%m/",
+                verbose_name="Error Report",
+            ),
+        ),
+    ]
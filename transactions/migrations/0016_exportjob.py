@@ -0,0 +1,105 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0015_importjob_error_report"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[("csv", "CSV"), ("ndjson", "NDJSON")],
+                        default="csv",
+                        max_length=10,
+                        verbose_name="Format",
+                    ),
+                ),
+                (
+                    "filters",
+                    models.JSONField(blank=True, default=dict, verbose_name="Filters"),
+                ),
+                (
+                    "params_hash",
+                    models.CharField(max_length=32, verbose_name="Parameters Hash"),
+                ),
+                ("data_version", models.BigIntegerField(verbose_name="Data Version")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        blank=True, upload_to="exports/%Y/%m/", verbose_name="File"
+                    ),
+                ),
+                ("rows", models.IntegerField(default=0, verbose_name="Rows")),
+                (
+                    "duration",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Duration (s)"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Finished"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Export Job",
+                "verbose_name_plural": "Export Jobs",
+                "ordering": ["-created_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status", "failed"), _negated=True),
+                        fields=("user", "params_hash", "data_version"),
+                        name="unique_export",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0016_exportjob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Новый индекс создаётся раньше, чем удаляется старый: запросы по дате
+    # не остаются без индекса.
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "date", "id"], name="transaction_user_id_a421ce_idx"
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_user_id_8af7f1_idx",
+        ),
+    ]
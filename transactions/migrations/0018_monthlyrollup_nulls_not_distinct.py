@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_uncategorized_rollups(apps, schema_editor):
+    """Сводит дубли строк без категории в одну перед новым ограничением."""
+    MonthlyRollup = apps.get_model("transactions", "MonthlyRollup")
+
+    groups = (
+        MonthlyRollup.objects.filter(category__isnull=True)
+        .values("user_id", "month", "type")
+        .annotate(
+            keep=Min("id"),
+            rows=Count("id"),
+            total_sum=Sum("total"),
+            count_sum=Sum("count"),
+        )
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for group in groups.iterator():
+        MonthlyRollup.objects.filter(pk=group["keep"]).update(
+            total=group["total_sum"], count=group["count_sum"]
+        )
+        MonthlyRollup.objects.filter(
+            user_id=group["user_id"],
+            month=group["month"],
+            type=group["type"],
+            category__isnull=True,
+        ).exclude(pk=group["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0017_transaction_keyset_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_uncategorized_rollups, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name="monthlyrollup",
+            name="unique_monthly_rollup",
+        ),
+        migrations.AddConstraint(
+            model_name="monthlyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "month", "type", "category"),
+                name="unique_monthly_rollup",
+                nulls_distinct=False,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0018_monthlyrollup_nulls_not_distinct"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="task_id",
+            field=models.CharField(blank=True, max_length=255, verbose_name="Task ID"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0019_importjob_task_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportjob",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Started"),
+        ),
+        migrations.AddField(
+            model_name="exportjob",
+            name="task_id",
+            field=models.CharField(blank=True, max_length=255, verbose_name="Task ID"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0020_exportjob_started_at_task_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="import_batch",
+            field=models.CharField(
+                blank=True, editable=False, max_length=32, verbose_name="Import Batch"
+            ),
+        ),
+    ]
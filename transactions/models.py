@@ -1,5 +1,8 @@
+import hashlib
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 
 from .managers import BudgetLimitManager, TransactionManager
@@ -7,6 +10,21 @@ from .managers import BudgetLimitManager, TransactionManager
 User = get_user_model()
 
 
+def normalize_description(text):
+    """Описание для сравнения: без лишних пробелов и без учёта регистра."""
+    return " ".join(text.split()).casefold()
+
+
+def transaction_fingerprint(user_id, date, amount, type_, description):
+    """
+    SHA-256 от (пользователь, дата, сумма, тип, нормализованное описание) —
+    по нему повторный импорт узнаёт уже загруженные строки.
+    """
+    amount = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    key = f"{user_id}|{date}|{amount}|{type_}|{normalize_description(description)}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Category Name")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
@@ -35,6 +53,8 @@ class Transaction(models.Model):
         (INCOME, "Income"),
         (EXPENSE, "Expense"),
     ]
+    LEDGER_FIELDS = ("user_id", "category_id", "type", "date", "amount")
+    FINGERPRINT_FIELDS = {"user", "user_id", "date", "amount", "type", "description"}
 
     user = models.ForeignKey(
         User,
@@ -54,6 +74,13 @@ class Transaction(models.Model):
         verbose_name="Category",
     )
     description = models.TextField(blank=True, verbose_name="Description")
+    fingerprint = models.CharField(
+        max_length=64, blank=True, editable=False, verbose_name="Fingerprint"
+    )
+    # Один вызов импорта CSV — одна пачка; у созданных вручную пусто.
+    import_batch = models.CharField(
+        max_length=32, blank=True, editable=False, verbose_name="Import Batch"
+    )
 
     objects = TransactionManager()
 
@@ -62,8 +89,10 @@ class Transaction(models.Model):
         verbose_name_plural = "Financial Transactions"
         ordering = ["-date", "-id"]
         indexes = [
-            models.Index(fields=["user", "date"]),
+            # Покрывает и фильтры по дате, и keyset-пагинацию по (date, id).
+            models.Index(fields=["user", "date", "id"]),
             models.Index(fields=["user", "type"]),
+            models.Index(fields=["user", "fingerprint"]),
         ]
 
     def __str__(self):
@@ -72,6 +101,43 @@ class Transaction(models.Model):
     def get_absolute_url(self):
         return reverse("transactions:transaction_detail", kwargs={"pk": self.pk})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Снимок загруженных значений — по нему пакетная запись (bulk) считает
+        # разницу агрегатов для строк, загруженных под select_for_update.
+        # Сигналы save()/delete() перечитывают строку сами.
+        if set(cls.LEDGER_FIELDS).issubset(field_names):
+            instance._ledger_state = instance.get_ledger_state()
+        return instance
+
+    def get_ledger_state(self):
+        return {
+            "user_id": self.user_id,
+            "category_id": self.category_id,
+            "type": self.type,
+            "date": self._meta.get_field("date").to_python(self.date),
+            "amount": self._meta.get_field("amount").to_python(self.amount),
+        }
+
+    def compute_fingerprint(self):
+        return transaction_fingerprint(
+            self.user_id, self.date, self.amount, self.type, self.description
+        )
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.compute_fingerprint()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.FINGERPRINT_FIELDS & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "fingerprint"}
+        # post_save обновляет счётчики — они должны попасть в ту же транзакцию БД.
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            return super().delete(*args, **kwargs)
+
 
 class BudgetLimit(models.Model):
     PERIOD_CHOICES = [("DAY", "Daily"), ("WEEK", "Weekly"), ("MONTH", "Monthly")]
@@ -104,3 +170,250 @@ class BudgetLimit(models.Model):
             f"{self.user.username}: {self.category.name} "
             f"- {self.limit_amount} ({self.get_period_display()})"
         )
+
+
+class SpendCounter(models.Model):
+    """Сумма расходов пользователя по категории за одно окно бюджета."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, verbose_name="Category"
+    )
+    period = models.CharField(
+        max_length=10, choices=BudgetLimit.PERIOD_CHOICES, verbose_name="Period"
+    )
+    period_start = models.DateField(verbose_name="Period Start")
+    amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Amount"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "category", "period", "period_start"],
+                name="unique_spend_counter",
+            )
+        ]
+        verbose_name = "Spend Counter"
+        verbose_name_plural = "Spend Counters"
+
+    def __str__(self):
+        return f"{self.category_id} {self.period} {self.period_start}: {self.amount}"
+
+
+class BudgetAlertState(models.Model):
+    """Состояние лимита в конкретном окне: письмо уходит только при переходе."""
+
+    OK = "ok"
+    WARNING = "warning"
+    EXCEEDED = "exceeded"
+    STATE_CHOICES = [(OK, "OK"), (WARNING, "Warning"), (EXCEEDED, "Exceeded")]
+    LEVELS = {OK: 0, WARNING: 1, EXCEEDED: 2}
+
+    budget = models.ForeignKey(
+        BudgetLimit,
+        on_delete=models.CASCADE,
+        related_name="alert_states",
+        verbose_name="Budget Limit",
+    )
+    period_start = models.DateField(verbose_name="Period Start")
+    state = models.CharField(
+        max_length=10, choices=STATE_CHOICES, default=OK, verbose_name="State"
+    )
+    spent = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Spent"
+    )
+    notified_state = models.CharField(
+        max_length=10,
+        choices=STATE_CHOICES,
+        default=OK,
+        verbose_name="Highest Notified State",
+    )
+    notify_pending = models.BooleanField(default=False, verbose_name="Pending")
+    notified_at = models.DateTimeField(null=True, blank=True, verbose_name="Sent At")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["budget", "period_start"], name="unique_budget_alert_state"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["notify_pending"],
+                name="alert_state_pending_idx",
+                condition=models.Q(notify_pending=True),
+            )
+        ]
+        verbose_name = "Budget Alert State"
+        verbose_name_plural = "Budget Alert States"
+
+    def __str__(self):
+        return f"{self.budget_id} {self.period_start}: {self.state}"
+
+
+class MonthlyRollup(models.Model):
+    """Сумма и число транзакций пользователя за месяц по типу и категории."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
+    month = models.DateField(verbose_name="Month")
+    type = models.CharField(
+        max_length=7, choices=Transaction.TYPE_CHOICES, verbose_name="Type"
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Category",
+    )
+    total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Total"
+    )
+    count = models.IntegerField(default=0, verbose_name="Count")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "month", "type", "category"],
+                name="unique_monthly_rollup",
+                nulls_distinct=False,
+            )
+        ]
+        indexes = [models.Index(fields=["user", "month"])]
+        verbose_name = "Monthly Rollup"
+        verbose_name_plural = "Monthly Rollups"
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.type} {self.category_id}: {self.total}"
+
+
+class ImportJob(models.Model):
+    """Фоновый импорт CSV: загруженный файл, статус и итоги обработки."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
+    file = models.FileField(upload_to="imports/%Y/%m/", verbose_name="File")
+    file_name = models.CharField(max_length=255, verbose_name="File Name")
+    file_hash = models.CharField(max_length=64, verbose_name="SHA-256")
+    file_size = models.BigIntegerField(default=0, verbose_name="Size")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Status"
+    )
+    rows_created = models.IntegerField(default=0, verbose_name="Rows Created")
+    rows_failed = models.IntegerField(default=0, verbose_name="Rows Failed")
+    rows_skipped = models.IntegerField(default=0, verbose_name="Rows Skipped")
+    # Первые ошибки для страницы; полный список — в error_report (gzip).
+    errors = models.JSONField(default=list, blank=True, verbose_name="Errors")
+    error_count = models.IntegerField(default=0, verbose_name="Error Count")
+    error_report = models.FileField(
+        upload_to="imports/errors/%Y/%m/", blank=True, verbose_name="Error Report"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Started")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished")
+    # Задача Celery, взявшая задание: её повторная доставка может его забрать.
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="Task ID")
+
+    class Meta:
+        constraints = [
+            # Один и тот же файл не обрабатывается дважды; упавший можно повторить.
+            models.UniqueConstraint(
+                fields=["user", "file_hash"],
+                condition=~models.Q(status="failed"),
+                name="unique_import_file",
+            )
+        ]
+        ordering = ["-created_at"]
+        verbose_name = "Import Job"
+        verbose_name_plural = "Import Jobs"
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+    def get_absolute_url(self):
+        return reverse("transactions:import-job", kwargs={"pk": self.pk})
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def error_report_url(self):
+        if not self.error_report:
+            return None
+        return reverse("transactions:import-job-errors", kwargs={"pk": self.pk})
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка транзакций в gzip-файл. Готовый файл переиспользуется
+    для тех же формата и фильтров, пока версия данных пользователя не сменится.
+    """
+
+    CSV = "csv"
+    NDJSON = "ndjson"
+    FORMAT_CHOICES = [(CSV, "CSV"), (NDJSON, "NDJSON")]
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = ImportJob.STATUS_CHOICES
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
+    format = models.CharField(
+        max_length=10, choices=FORMAT_CHOICES, default=CSV, verbose_name="Format"
+    )
+    filters = models.JSONField(default=dict, blank=True, verbose_name="Filters")
+    params_hash = models.CharField(max_length=32, verbose_name="Parameters Hash")
+    data_version = models.BigIntegerField(verbose_name="Data Version")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Status"
+    )
+    file = models.FileField(upload_to="exports/%Y/%m/", blank=True, verbose_name="File")
+    rows = models.IntegerField(default=0, verbose_name="Rows")
+    duration = models.FloatField(null=True, blank=True, verbose_name="Duration (s)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Started")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished")
+    # Задача Celery, взявшая задание: её повторная доставка может его забрать.
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="Task ID")
+
+    class Meta:
+        constraints = [
+            # Одинаковый запрос при неизменных данных — одно задание.
+            models.UniqueConstraint(
+                fields=["user", "params_hash", "data_version"],
+                condition=~models.Q(status="failed"),
+                name="unique_export",
+            )
+        ]
+        ordering = ["-created_at"]
+        verbose_name = "Export Job"
+        verbose_name_plural = "Export Jobs"
+
+    def __str__(self):
+        return f"{self.get_format_display()} export ({self.status})"
+
+    def get_absolute_url(self):
+        return reverse("transactions:export-job", kwargs={"pk": self.pk})
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def download_name(self):
+        return f"transactions.{self.format}.gz"
@@ -0,0 +1,93 @@
+"""
+Пагинация API транзакций.
+
+По умолчанию — обычная PageNumberPagination (count + номера страниц).
+С ?pagination=cursor (дальше — по ссылке next с ?cursor=) включается
+keyset-пагинация по (date, id) от новых к старым: без COUNT(*) и OFFSET,
+каждая страница — короткий проход по индексу (user, date, id), а вставки
+между запросами не сдвигают уже выданные страницы. Порядок у неё
+фиксированный, поэтому ?ordering= вместе с ней отклоняется с 400.
+"""
+
+import base64
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+KEYSET_MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(transaction):
+    position = f"{transaction.date.isoformat()}|{transaction.pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(date, id) из курсора; NotFound для испорченного значения."""
+    try:
+        day, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(day), int(pk)
+    except (ValueError, UnicodeError):
+        raise NotFound("Invalid cursor.")
+
+
+class TransactionPagination(PageNumberPagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = KEYSET_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (
+            request.query_params.get("pagination") == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            raise ValidationError(
+                {
+                    api_settings.ORDERING_PARAM: [
+                        "Cursor pagination is always newest first (-date, -id); "
+                        "ordering is not supported."
+                    ]
+                }
+            )
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by("-date", "-id")
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            day, pk = decode_cursor(cursor)
+            # date <= day — условие индекса: проход начинается прямо с курсора.
+            queryset = queryset.filter(
+                Q(date__lte=day) & (Q(date__lt=day) | Q(pk__lt=pk))
+            )
+        rows = list(queryset[: page_size + 1])
+        self.next_cursor = (
+            encode_cursor(rows[page_size - 1]) if rows[page_size:] else None
+        )
+        return rows[:page_size]
+
+    def get_page_size(self, request):
+        if not getattr(self, "keyset", False):
+            # Для номеров страниц размер остаётся фиксированным, как раньше.
+            return self.page_size
+        return super().get_page_size(request)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        next_link = None
+        if self.next_cursor:
+            next_link = replace_query_param(
+                self.request.build_absolute_uri(),
+                self.cursor_query_param,
+                self.next_cursor,
+            )
+        return Response({"next": next_link, "results": data})
@@ -0,0 +1,210 @@
+"""Отчёты поверх MonthlyRollup: O(месяцев), а не O(транзакций)."""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+
+from .models import MonthlyRollup, Transaction
+
+
+def monthly_totals(user):
+    """{(месяц, тип): сумма} по всем категориям пользователя."""
+    rows = (
+        MonthlyRollup.objects.filter(user=user, count__gt=0)
+        .values("month", "type")
+        .annotate(total=Sum("total"))
+        .order_by("month")
+    )
+    return {(row["month"], row["type"]): row["total"] for row in rows}
+
+
+def monthly_statistics(user):
+    """Данные для графиков статистики: месяцы и суммы доходов/расходов."""
+    totals = monthly_totals(user)
+    months = sorted({month for month, _ in totals})
+    return {
+        "months": [month.strftime("%Y-%m") for month in months],
+        "income": [
+            float(totals.get((month, Transaction.INCOME), 0)) for month in months
+        ],
+        "expense": [
+            float(totals.get((month, Transaction.EXPENSE), 0)) for month in months
+        ],
+    }
+
+
+def month_aligned(date_from, date_to):
+    """Границы периода совпадают с границами месяцев (или не заданы)."""
+    return (date_from is None or date_from.day == 1) and (
+        date_to is None or (date_to + timedelta(days=1)).day == 1
+    )
+
+
+def summary_values(row):
+    income, expense = row["income"], row["expense"]
+    return {
+        "income": float(income),
+        "expense": float(expense),
+        "balance": float(income - expense),
+        "count": row["count"],
+    }
+
+
+def transaction_summary(
+    user, date_from=None, date_to=None, category=None, type_=None, by_category=False
+):
+    """
+    Доход, расход, баланс и число транзакций одним условным агрегатом.
+    Для периодов из целых месяцев (и без периода) считается по MonthlyRollup —
+    O(месяцев), иначе по Transaction. by_category добавляет разбивку по
+    категориям тем же запросом: итоги складываются из её строк.
+    """
+    if month_aligned(date_from, date_to):
+        rows = MonthlyRollup.objects.filter(user=user)
+        if date_from:
+            rows = rows.filter(month__gte=date_from)
+        if date_to:
+            rows = rows.filter(month__lte=date_to)
+        amount, count = "total", Sum("count", default=0)
+    else:
+        rows = Transaction.objects.filter(user=user)
+        if date_from:
+            rows = rows.filter(date__gte=date_from)
+        if date_to:
+            rows = rows.filter(date__lte=date_to)
+        amount, count = "amount", Count("id")
+    if category is not None:
+        rows = rows.filter(category_id=category)
+    if type_:
+        rows = rows.filter(type=type_)
+
+    aggregates = {
+        "income": Sum(amount, filter=Q(type=Transaction.INCOME), default=Decimal("0")),
+        "expense": Sum(
+            amount, filter=Q(type=Transaction.EXPENSE), default=Decimal("0")
+        ),
+        "count": count,
+    }
+    if not by_category:
+        return summary_values(rows.aggregate(**aggregates))
+
+    groups = [
+        group
+        for group in rows.values("category_id", "category__name")
+        .annotate(**aggregates)
+        .order_by("category__name")
+        if group["count"]
+    ]
+    summary = summary_values(
+        {key: sum(group[key] for group in groups) for key in aggregates}
+    )
+    summary["categories"] = [
+        {
+            "category_id": group["category_id"],
+            "category": group["category__name"],
+            **summary_values(group),
+        }
+        for group in groups
+    ]
+    return summary
+
+
+# Единица numpy.datetime64 и шаг в этих единицах для каждой гранулярности.
+GRANULARITY_UNITS = {
+    "day": ("D", 1),
+    "week": ("D", 7),
+    "month": ("M", 1),
+    "year": ("Y", 1),
+}
+
+
+class RangeTooLong(ValueError):
+    """Ряд получился бы длиннее допустимого числа корзин."""
+
+
+def bucket_start(day, granularity):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def time_series(
+    user,
+    granularity="month",
+    date_from=None,
+    date_to=None,
+    by_category=False,
+    type_=None,
+    max_buckets=None,
+):
+    """
+    Ряды сумм по корзинам day/week/month/year за один запрос к БД.
+    Пропуски заполняются нулями векторно (numpy.add.at по индексам корзин).
+    Незаданная граница берётся по данным; если итоговая ось длиннее
+    max_buckets, бросает RangeTooLong.
+    """
+    queryset = Transaction.objects.filter(user=user)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if type_:
+        queryset = queryset.filter(type=type_)
+
+    fields = ["bucket", "type"]
+    if by_category:
+        fields += ["category_id", "category__name"]
+    rows = list(
+        queryset.annotate(bucket=Trunc("date", granularity))
+        .values(*fields)
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+
+    if not rows and not (date_from and date_to):
+        return {"granularity": granularity, "buckets": [], "series": []}
+
+    unit, step = GRANULARITY_UNITS[granularity]
+    buckets = np.array([row["bucket"] for row in rows], dtype="datetime64[D]")
+    first = bucket_start(date_from, granularity) if date_from else buckets.min()
+    last = bucket_start(date_to, granularity) if date_to else buckets.max()
+    first, last = np.datetime64(first, unit), np.datetime64(last, unit)
+    if max_buckets and (last - first).astype(int) // step >= max_buckets:
+        raise RangeTooLong(f"Range is too long: at most {max_buckets} buckets.")
+    axis = np.arange(first, last + step, step)
+
+    series_keys = sorted(
+        {tuple(row[field] for field in fields[1:]) for row in rows},
+        key=lambda key: tuple("" if part is None else str(part) for part in key),
+    )
+    series_index = {key: index for index, key in enumerate(series_keys)}
+    values = np.zeros((len(series_keys), len(axis)))
+    if rows:
+        positions = (buckets.astype(f"datetime64[{unit}]") - first).astype(int) // step
+        np.add.at(
+            values,
+            (
+                [series_index[tuple(row[f] for f in fields[1:])] for row in rows],
+                positions,
+            ),
+            np.array([float(row["total"]) for row in rows]),
+        )
+
+    series = []
+    for key, row_values in zip(series_keys, np.round(values, 2).tolist()):
+        item = {"type": key[0], "values": row_values}
+        if by_category:
+            item["category_id"], item["category"] = key[1], key[2]
+        series.append(item)
+    return {
+        "granularity": granularity,
+        "buckets": [str(bucket) for bucket in axis.astype("datetime64[D]")],
+        "series": series,
+    }
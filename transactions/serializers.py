@@ -40,6 +40,121 @@ class TransactionSerializer(serializers.ModelSerializer):
         return value
 
 
+class TransactionBatchItemSerializer(TransactionSerializer):
+    """Элемент пакета: категория проверяется по заранее загруженным, без запросов."""
+
+    category = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_category(self, value):
+        if value is None:
+            return None
+        category = self.context["categories"].get(value)
+        if category is None:
+            raise serializers.ValidationError("Invalid category.")
+        return category
+
+
+def batch_ids(values):
+    """Целые id из сырых значений; остальное отсеет проверка элементов."""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+class TransactionBatchSerializer(serializers.Serializer):
+    """
+    Пакет {"create": [...], "update": [{"id": ...}, ...], "delete": [id, ...]}.
+    Категории и изменяемые транзакции загружаются двумя запросами на весь
+    пакет; ошибки возвращаются по индексу элемента ({} — элемент в порядке).
+    Изменяемые транзакции блокируются (SELECT ... FOR UPDATE), поэтому
+    проверка и запись пакета должны идти в одной transaction.atomic().
+    """
+
+    MAX_ITEMS = 5000
+
+    create = serializers.ListField(child=serializers.DictField(), required=False)
+    update = serializers.ListField(child=serializers.DictField(), required=False)
+    delete = serializers.ListField(child=serializers.JSONField(), required=False)
+
+    def validate(self, attrs):
+        create = attrs.get("create", [])
+        update = attrs.get("update", [])
+        delete = attrs.get("delete", [])
+        total = len(create) + len(update) + len(delete)
+        if not total:
+            raise serializers.ValidationError("The batch is empty.")
+        if total > self.MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"Too many items: at most {self.MAX_ITEMS} per batch."
+            )
+
+        user = self.context["request"].user
+        categories = Category.objects.filter(
+            user=user,
+            pk__in=batch_ids(item.get("category") for item in create + update),
+        ).in_bulk()
+        transactions = (
+            Transaction.objects.filter(
+                user=user,
+                pk__in=batch_ids([item.get("id") for item in update] + delete),
+            )
+            .select_related("category")
+            .select_for_update(of=("self",))
+            .order_by("pk")
+            .in_bulk()
+        )
+        context = {**self.context, "categories": categories}
+        seen = set()
+
+        def find(value):
+            """Транзакция пользователя по id; каждую можно тронуть один раз."""
+            try:
+                pk = int(value)
+            except (TypeError, ValueError):
+                return None, "A valid integer is required."
+            if pk not in transactions:
+                return None, "Not found."
+            if pk in seen:
+                return None, "Duplicate id."
+            seen.add(pk)
+            return transactions[pk], None
+
+        errors = {"create": [], "update": [], "delete": []}
+        validated = {"create": [], "update": [], "delete": []}
+        for item in create:
+            item_serializer = TransactionBatchItemSerializer(data=item, context=context)
+            if item_serializer.is_valid():
+                validated["create"].append(item_serializer.validated_data)
+            errors["create"].append(item_serializer.errors)
+        for item in update:
+            instance, error = find(item.get("id"))
+            item_serializer = TransactionBatchItemSerializer(
+                instance, data=item, partial=True, context=context
+            )
+            item_serializer.is_valid()
+            item_errors = dict(item_serializer.errors)
+            if error:
+                item_errors["id"] = [error]
+            elif not item_errors:
+                validated["update"].append((instance, item_serializer.validated_data))
+            errors["update"].append(item_errors)
+        for value in delete:
+            instance, error = find(value)
+            if instance:
+                validated["delete"].append(instance)
+            errors["delete"].append({"id": [error]} if error else {})
+
+        if any(any(item_errors) for item_errors in errors.values()):
+            raise serializers.ValidationError(
+                {key: value for key, value in errors.items() if value}
+            )
+        return validated
+
+
 class BudgetLimitSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source="category.name", read_only=True)
     period_display = serializers.CharField(source="get_period_display", read_only=True)
@@ -55,3 +170,48 @@ class BudgetLimitSerializer(serializers.ModelSerializer):
             "period_display",
         ]
         read_only_fields = ["id"]
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    """Общие параметры отчётов: период и тип."""
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    type = serializers.ChoiceField(choices=Transaction.TYPE_CHOICES, required=False)
+    split = serializers.ChoiceField(choices=["category"], required=False)
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get("date_from"), attrs.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError(
+                "date_from must not be later than date_to."
+            )
+        return attrs
+
+
+class TimeSeriesQuerySerializer(ReportQuerySerializer):
+    """Параметры запроса временных рядов статистики."""
+
+    MAX_BUCKETS = 1000
+    BUCKET_DAYS = {"day": 1, "week": 7, "month": 28, "year": 365}
+
+    granularity = serializers.ChoiceField(
+        choices=list(BUCKET_DAYS), default="month", required=False
+    )
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        date_from, date_to = attrs.get("date_from"), attrs.get("date_to")
+        if date_from and date_to:
+            days = (date_to - date_from).days
+            if days // self.BUCKET_DAYS[attrs["granularity"]] >= self.MAX_BUCKETS:
+                raise serializers.ValidationError(
+                    f"Range is too long: at most {self.MAX_BUCKETS} buckets."
+                )
+        return attrs
+
+
+class SummaryQuerySerializer(ReportQuerySerializer):
+    """Параметры сводки: фильтры списка и ?split=category."""
+
+    category = serializers.IntegerField(required=False, min_value=1)
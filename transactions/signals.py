@@ -1,45 +1,109 @@
-import logging
-
 from django.contrib.auth.models import User
-from django.core.cache import cache
-from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import Category, Transaction
+from .models import BudgetLimit, Category, Transaction
+
+
+def locked_ledger_state(pk):
+    """Текущие значения строки под блокировкой до конца транзакции."""
+    return (
+        Transaction.objects.select_for_update()
+        .filter(pk=pk)
+        .values(*Transaction.LEDGER_FIELDS)
+        .first()
+    )
 
-logger = logging.getLogger(__name__)
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_delete, sender=Transaction)
+def remember_transaction_state(sender, instance, **kwargs):
+    """
+    Прежние значения для разницы агрегатов читаются из БД с блокировкой, а
+    не из снимка при загрузке: иначе две параллельные правки одной строки
+    вычли бы одну и ту же старую сумму. save() и delete() идут в
+    transaction.atomic(), так что блокировка держится до записи агрегатов.
+    """
+    if instance.pk:
+        instance._ledger_state = locked_ledger_state(instance.pk)
 
 
 @receiver(post_save, sender=Transaction)
 def on_transaction_save(sender, instance, created, **kwargs):
+    from .aggregates import apply_transaction_change
+    from .caching import (
+        invalidate_budget_alerts_for_deltas,
+        patch_cached_statistics_on_commit,
+    )
+
+    new_state = instance.get_ledger_state()
+    # Transaction.save() идёт в transaction.atomic(), так что агрегаты и
+    # отметка дельты статистики (см. caching) успевают до коммита.
+    spend_deltas, rollup_deltas = apply_transaction_change(
+        getattr(instance, "_ledger_state", None), new_state
+    )
+    invalidate_budget_alerts_for_deltas(spend_deltas)
+    patch_cached_statistics_on_commit(rollup_deltas)
+    instance._ledger_state = new_state
+
     if instance.type == Transaction.EXPENSE:
-        from .utils import check_budget_limits
-
-        alerts = check_budget_limits(instance.user)
-        for alert in alerts:
-            if alert["is_exceeded"]:
-                logger.warning(
-                    "Budget exceeded for user=%s category=%s: spent=%s limit=%s",
-                    instance.user.username,
-                    alert["category"],
-                    alert["spent"],
-                    alert["limit"],
-                )
-                if created and instance.user.email:
-                    from .tasks import send_budget_alert_email_task
-
-                    send_budget_alert_email_task.delay(
-                        user_email=instance.user.email,
-                        username=instance.user.username,
-                        alert=alert,
-                    )
-
-    cache.delete(f"stats_{instance.user.id}")
+        from .utils import request_budget_evaluation
+
+        request_budget_evaluation(instance.user)
 
 
 @receiver(post_delete, sender=Transaction)
 def on_transaction_delete(sender, instance, **kwargs):
-    cache.delete(f"stats_{instance.user.id}")
+    from .aggregates import apply_transaction_change
+    from .caching import (
+        invalidate_budget_alerts_for_deltas,
+        patch_cached_statistics_on_commit,
+    )
+
+    old_state = getattr(instance, "_ledger_state", None) or instance.get_ledger_state()
+    spend_deltas, rollup_deltas = apply_transaction_change(old_state, None)
+    invalidate_budget_alerts_for_deltas(spend_deltas)
+    patch_cached_statistics_on_commit(rollup_deltas)
+
+
+@receiver(post_save, sender=BudgetLimit)
+@receiver(post_delete, sender=BudgetLimit)
+def on_budget_limit_change(sender, instance, **kwargs):
+    from .caching import invalidate_budget_alerts_on_commit
+    from .utils import schedule_budget_evaluation
+
+    invalidate_budget_alerts_on_commit(instance.user_id)
+    user_id = instance.user_id
+    transaction.on_commit(lambda: schedule_budget_evaluation(user_id))
+
+
+@receiver(post_save, sender=Category)
+def on_category_save(sender, instance, created, **kwargs):
+    # Название категории попадает в текст оповещений.
+    if not created and instance.budgetlimit_set.exists():
+        from .caching import invalidate_budget_alerts_on_commit
+
+        invalidate_budget_alerts_on_commit(instance.user_id)
+
+
+@receiver(pre_delete, sender=Category)
+def merge_deleted_category_rollups(sender, instance, **kwargs):
+    from .aggregates import merge_category_rollups
+
+    merge_category_rollups(instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=BudgetLimit)
+@receiver(post_delete, sender=BudgetLimit)
+def bump_user_data_version(sender, instance, **kwargs):
+    from .caching import bump_data_version_on_commit
+
+    bump_data_version_on_commit(instance.user_id)
 
 
 @receiver(post_save, sender=User)
@@ -49,3 +113,7 @@ def create_default_categories(sender, instance, created, **kwargs):
         Category.objects.bulk_create(
             [Category(name=name, user=instance) for name in default_categories]
         )
+        # bulk_create не шлёт сигналы — версию данных поднимаем сами.
+        from .caching import bump_data_version_on_commit
+
+        bump_data_version_on_commit(instance.pk)
@@ -1,39 +1,217 @@
 import logging
+from collections import defaultdict
 
 from celery import shared_task
 from django.conf import settings
-from django.core.mail import send_mail
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BudgetAlertState
 
 logger = logging.getLogger(__name__)
 
 
+def build_budget_digest(user, states):
+    """Одно письмо со всеми сработавшими лимитами пользователя."""
+    exceeded = sum(state.state == BudgetAlertState.EXCEEDED for state in states)
+    if exceeded:
+        subject = f"Budget Alert: {exceeded} limit(s) exceeded"
+    else:
+        subject = f"Budget Alert: {len(states)} limit(s) close to exceeding"
+
+    lines = []
+    for state in states:
+        budget = state.budget
+        limit = float(budget.limit_amount)
+        spent = float(state.spent)
+        percentage = round(spent / limit * 100, 1) if limit > 0 else 0
+        lines.append(
+            f"  {budget.category.name} ({budget.get_period_display().lower()}): "
+            f"{spent:.2f} of {limit:.2f} ({percentage}%) — "
+            f"{state.get_state_display().lower()}"
+        )
+
+    body = (
+        f"Hi {user.username},\n\n"
+        "Your budget limits need attention:\n\n"
+        + "\n".join(lines)
+        + "\n\nConsider reviewing your expenses.\n\n"
+        "— Finance Manager"
+    )
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def send_budget_alert_email_task(self, user_email, username, alert):
-    """
-    Фоновая задача отправки email при превышении бюджета.
-    При ошибке повторяет попытку до 3 раз с интервалом 60 секунд.
-    """
-    subject = f"Budget Alert: {alert['category']} limit exceeded"
-    message = (
-        f"Hi {username},\n\n"
-        f"You have exceeded your {alert['period'].lower()} budget limit "
-        f"for category \"{alert['category']}\".\n\n"
-        f"  Spent:  {alert['spent']:.2f}\n"
-        f"  Limit:  {alert['limit']:.2f}\n"
-        f"  Usage:  {alert['percentage']}%\n\n"
-        f"Consider reviewing your expenses.\n\n"
-        f"— Finance Manager"
+def deliver_budget_alerts_task(self, batch_size=100):
+    """
+    Рассылает накопленные оповещения о бюджете.
+    Все оповещения пользователя — одним письмом, пачка пользователей —
+    через одно SMTP-соединение. При ошибке повторяет попытку до 3 раз.
+
+    Строки пачки блокируются до отправки (SKIP LOCKED), поэтому
+    параллельные запуски не шлют одно письмо дважды. Флаг снимается
+    только там, где уровень не поднялся после чтения.
+    """
+    pending = BudgetAlertState.objects.filter(notify_pending=True)
+    user_ids = list(
+        pending.values_list("budget__user_id", flat=True).distinct().order_by()
     )
 
+    sent = 0
+    for offset in range(0, len(user_ids), batch_size):
+        with transaction.atomic():
+            states = (
+                pending.filter(
+                    budget__user_id__in=user_ids[offset : offset + batch_size]
+                )
+                .select_related("budget__user", "budget__category")
+                .select_for_update(skip_locked=True, of=("self",))
+                .order_by("budget__user_id", "budget_id")
+            )
+
+            by_user = defaultdict(list)
+            for state in states:
+                by_user[state.budget.user].append(state)
+
+            messages = [
+                build_budget_digest(user, user_states)
+                for user, user_states in by_user.items()
+                if user.email
+            ]
+            try:
+                with get_connection(fail_silently=False) as connection:
+                    sent += connection.send_messages(messages) or 0
+            except Exception as exc:
+                logger.error("Failed to send budget alert digests: %s", exc)
+                raise self.retry(exc=exc)
+
+            delivered = defaultdict(list)
+            for user_states in by_user.values():
+                for state in user_states:
+                    delivered[state.notified_state].append(state.pk)
+            for notified_state, pks in delivered.items():
+                BudgetAlertState.objects.filter(
+                    pk__in=pks, notified_state=notified_state
+                ).update(notify_pending=False, notified_at=timezone.now())
+
+    logger.info("Sent %s budget alert digest(s)", sent)
+    return sent
+
+
+@shared_task
+def send_budget_alert_email_task(user_email, username, alert):
+    """
+    Устарело: письма о бюджете шлёт deliver_budget_alerts_task дайджестами.
+    Оставлено на один релиз для задач, поставленных до обновления: лимиты
+    пользователя проверяются заново, и письмо уходит дайджестом, если
+    уровень ещё не был отправлен.
+    """
+    from .utils import evaluate_budgets
+
+    logger.warning(
+        "send_budget_alert_email_task is deprecated, forwarding %s to the digest",
+        username,
+    )
+    user = get_user_model().objects.filter(username=username).first()
+    if user is not None:
+        evaluate_budgets(user)
+
+
+@shared_task
+def evaluate_user_budgets_task(user_id):
+    """
+    Отложенная проверка бюджетов пользователя после серии записей.
+    Флаг снимается до проверки: записи, пришедшие во время неё,
+    запланируют следующую.
+    """
+    from .utils import budget_dirty_key, evaluate_budgets
+
+    cache.delete(budget_dirty_key(user_id))
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    evaluate_budgets(user)
+
+
+@shared_task
+def sweep_budget_periods_task():
+    """Плановая проверка бюджетов: смена периодов и правки лимитов."""
+    from .utils import sweep_budget_periods
+
+    return sweep_budget_periods(chunk_size=settings.BUDGET_SWEEP_CHUNK_SIZE)
+
+
+@shared_task
+def refresh_statistics_task(user_id):
+    """Фоновое обновление устаревшей статистики; снимает блокировку пользователя."""
+    from .caching import refresh_statistics, stats_lock_key
+
     try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user_email],
-            fail_silently=False,
-        )
-        logger.info("Budget alert email sent to %s", user_email)
-    except Exception as exc:
-        logger.error("Failed to send email to %s: %s", user_email, exc)
-        raise self.retry(exc=exc)
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if user is not None:
+            refresh_statistics(user)
+    finally:
+        cache.delete(stats_lock_key(user_id))
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def import_csv_task(self, job_id):
+    """
+    Фоновый импорт загруженного CSV (ImportJob).
+    Сообщение подтверждается после выполнения: если воркер погиб, задача
+    придёт снова. Пока пульс прежнего запуска не устарел, она откладывает
+    себя до этого момента и затем забирает своё задание.
+    """
+    from .importers import run_import_job
+    from .jobs import reclaim_delay
+    from .models import ImportJob
+
+    result = run_import_job(job_id, task_id=self.request.id)
+    if result is None:
+        delay = reclaim_delay(ImportJob, job_id, self.request.id)
+        if delay is not None:
+            raise self.retry(countdown=delay)
+        return None
+    return {key: result.get(key) for key in ("created", "failed", "rows_per_second")}
+
+
+@shared_task
+def fail_stale_import_jobs_task():
+    """Плановая уборка: зависшие импорты помечаются упавшими."""
+    from .importers import fail_stale_import_jobs
+
+    return fail_stale_import_jobs()
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def export_transactions_task(self, job_id):
+    """
+    Фоновая выгрузка транзакций в gzip-файл (ExportJob). Повторная доставка
+    после гибели воркера забирает задание так же, как import_csv_task.
+    """
+    from .exporters import run_export_job
+    from .jobs import reclaim_delay
+    from .models import ExportJob
+
+    result = run_export_job(job_id, task_id=self.request.id)
+    if result is None:
+        delay = reclaim_delay(ExportJob, job_id, self.request.id)
+        if delay is not None:
+            raise self.retry(countdown=delay)
+    return result
+
+
+@shared_task
+def fail_stale_export_jobs_task():
+    """Плановая уборка: зависшие выгрузки помечаются упавшими."""
+    from .exporters import fail_stale_export_jobs
+
+    return fail_stale_export_jobs()
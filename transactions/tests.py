@@ -1,13 +1,83 @@
+import gzip
+import json
+import tempfile
+from datetime import date, timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from .forms import BudgetLimitForm, TransactionForm
-from .models import BudgetLimit, Category, Transaction
-from .utils import check_budget_limits
+from .caching import (
+    budget_alerts_cache_stats,
+    data_cache_key,
+    data_etag,
+    data_version,
+    get_budget_alerts,
+    get_redis_client,
+    get_statistics,
+    refresh_statistics,
+    stats_keys,
+)
+from .exporters import (
+    copy_csv_chunks,
+    copy_export_supported,
+    export_rows,
+    resolve_export_mode,
+    run_export_job,
+    stream_csv,
+)
+from .forecasting import forecast_budgets
+from .forms import BudgetLimitForm, CSVImportForm, TransactionForm
+from .importers import (
+    copy_import_supported,
+    create_import_job,
+    fail_stale_import_jobs,
+    import_job_status,
+    import_progress_key,
+    import_transactions_from_csv,
+    resolve_import_mode,
+    resolve_import_workers,
+    run_import_job,
+    staging_row,
+)
+from .jobs import heartbeat, heartbeat_key, reclaim_delay
+from .models import (
+    BudgetAlertState,
+    BudgetLimit,
+    Category,
+    ExportJob,
+    ImportJob,
+    MonthlyRollup,
+    SpendCounter,
+    Transaction,
+    transaction_fingerprint,
+)
+from .reports import monthly_statistics, time_series, transaction_summary
+from .serializers import TransactionBatchSerializer
+from .tasks import (
+    deliver_budget_alerts_task,
+    evaluate_user_budgets_task,
+    send_budget_alert_email_task,
+)
+from .utils import (
+    budget_dirty_key,
+    check_budget_limits,
+    evaluate_budgets,
+    get_period_start,
+    sweep_budget_periods,
+)
 
 User = get_user_model()
 
@@ -25,6 +95,7 @@ class BaseTestCase(TestCase):
         self.category, _ = Category.objects.get_or_create(name="Food", user=self.user)
         self.client = Client()
         self.client.login(username="testuser", password="testpass123")
+        cache.clear()
 
 
 # ─── Models ───────────────────────────────────────────────────────────────────
@@ -133,6 +204,941 @@ class BudgetUtilsTest(BaseTestCase):
         alerts = check_budget_limits(self.user)
         self.assertEqual(alerts, [])
 
+    def test_all_periods_evaluated_in_one_query(self):
+        transport, _ = Category.objects.get_or_create(name="Transport", user=self.user)
+        BudgetLimit.objects.create(
+            user=self.user, category=transport, limit_amount=10, period="DAY"
+        )
+        BudgetLimit.objects.create(
+            user=self.user, category=self.category, limit_amount=50, period="WEEK"
+        )
+        today = timezone.localdate()
+        for category in (self.category, transport):
+            Transaction.objects.create(
+                user=self.user,
+                amount=Decimal("20.00"),
+                category=category,
+                type=Transaction.EXPENSE,
+                date=today,
+            )
+        with self.assertNumQueries(1):
+            alerts = check_budget_limits(self.user)
+        self.assertEqual(
+            [(a["category"], a["period"], a["spent"]) for a in alerts],
+            [
+                ("Food", "Monthly", 20.0),
+                ("Transport", "Daily", 20.0),
+                ("Food", "Weekly", 20.0),
+            ],
+        )
+
+    def test_spending_before_period_start_is_ignored(self):
+        Transaction.objects.create(
+            user=self.user,
+            amount=Decimal("500.00"),
+            category=self.category,
+            type=Transaction.EXPENSE,
+            date=get_period_start("MONTH") - timedelta(days=1),
+        )
+        self.assertEqual(check_budget_limits(self.user), [])
+
+
+class SpendCounterTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.transaction = Transaction.objects.create(
+            user=self.user,
+            amount=Decimal("40.00"),
+            category=self.category,
+            type=Transaction.EXPENSE,
+            date=self.today,
+        )
+
+    def counters(self):
+        return {
+            (c.category.name, c.period, c.period_start): c.amount
+            for c in SpendCounter.objects.filter(user=self.user).exclude(amount=0)
+        }
+
+    def test_create_fills_every_period(self):
+        self.assertEqual(
+            self.counters(),
+            {
+                ("Food", period, get_period_start(period, self.today)): Decimal("40")
+                for period in ("DAY", "WEEK", "MONTH")
+            },
+        )
+
+    def test_update_moves_amount_between_categories(self):
+        transport, _ = Category.objects.get_or_create(name="Transport", user=self.user)
+        self.transaction.category = transport
+        self.transaction.amount = Decimal("15.50")
+        self.transaction.save()
+        counters = self.counters()
+        self.assertEqual(counters[("Transport", "DAY", self.today)], Decimal("15.50"))
+        self.assertNotIn(("Food", "DAY", self.today), counters)
+
+    def test_switch_to_income_and_delete(self):
+        Transaction.objects.filter(pk=self.transaction.pk).get().delete()
+        self.assertEqual(self.counters(), {})
+
+        income = Transaction.objects.create(
+            user=self.user,
+            amount=Decimal("10.00"),
+            category=self.category,
+            type=Transaction.INCOME,
+            date=self.today,
+        )
+        income.type = Transaction.EXPENSE
+        income.save()
+        self.assertEqual(self.counters()[("Food", "DAY", self.today)], Decimal("10"))
+
+    def test_stale_instances_do_not_subtract_old_amount_twice(self):
+        first = Transaction.objects.get(pk=self.transaction.pk)
+        second = Transaction.objects.get(pk=self.transaction.pk)
+        first.amount = Decimal("25.00")
+        first.save()
+        second.amount = Decimal("30.00")
+        second.save()
+        self.assertEqual(self.counters()[("Food", "DAY", self.today)], Decimal("30"))
+
+        Transaction.objects.create(
+            user=self.user,
+            amount=Decimal("5.00"),
+            category=self.category,
+            type=Transaction.EXPENSE,
+            date=self.today,
+        )
+        first.delete()
+        self.assertEqual(self.counters()[("Food", "DAY", self.today)], Decimal("5"))
+
+    def test_rebuild_repairs_drift(self):
+        BudgetLimit.objects.create(
+            user=self.user, category=self.category, limit_amount=100, period="MONTH"
+        )
+        SpendCounter.objects.filter(user=self.user).update(amount=999)
+        self.assertTrue(get_budget_alerts(self.user)[0]["is_exceeded"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_spend_counters", stdout=StringIO())
+        self.assertEqual(
+            self.counters()[("Food", "MONTH", get_period_start("MONTH", self.today))],
+            Decimal("40"),
+        )
+        # Исправленные траты видны сразу, а не со сменой дня.
+        self.assertEqual(get_budget_alerts(self.user)[0]["spent"], 40.0)
+
+
+class MonthlyRollupTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for amount, type_, category, day in [
+            ("1000.00", Transaction.INCOME, None, date(2026, 1, 5)),
+            ("40.00", Transaction.EXPENSE, self.category, date(2026, 1, 10)),
+            ("10.00", Transaction.EXPENSE, None, date(2026, 2, 1)),
+            ("15.00", Transaction.EXPENSE, None, date(2026, 2, 3)),
+        ]:
+            Transaction.objects.create(
+                user=self.user, amount=amount, type=type_, category=category, date=day
+            )
+
+    def rollups(self):
+        return sorted(
+            (r.month.strftime("%Y-%m"), r.type, r.category_id or 0, r.total, r.count)
+            for r in MonthlyRollup.objects.filter(user=self.user).exclude(count=0)
+        )
+
+    def test_writes_keep_rollup_in_sync(self):
+        expected = [
+            ("2026-01", "expense", self.category.pk, Decimal("40"), 1),
+            ("2026-01", "income", 0, Decimal("1000"), 1),
+            ("2026-02", "expense", 0, Decimal("25"), 2),
+        ]
+        self.assertEqual(self.rollups(), expected)
+
+        moved = Transaction.objects.get(amount=Decimal("40.00"))
+        moved.date = date(2026, 2, 20)
+        moved.save()
+        Transaction.objects.get(amount=Decimal("15.00")).delete()
+        self.assertEqual(
+            self.rollups(),
+            [
+                ("2026-01", "income", 0, Decimal("1000"), 1),
+                ("2026-02", "expense", 0, Decimal("10"), 1),
+                ("2026-02", "expense", self.category.pk, Decimal("40"), 1),
+            ],
+        )
+
+        call_command("rebuild_monthly_rollups", stdout=StringIO())
+        self.assertEqual(len(self.rollups()), 3)
+
+    def test_statistics_and_summary_read_rollup(self):
+        with self.assertNumQueries(1):
+            data = monthly_statistics(self.user)
+        self.assertEqual(
+            data,
+            {
+                "months": ["2026-01", "2026-02"],
+                "income": [1000.0, 0],
+                "expense": [40.0, 25.0],
+            },
+        )
+        response = self.client.get("/api/transactions/summary/")
+        self.assertEqual(
+            response.json(),
+            {"income": 1000.0, "expense": 65.0, "balance": 935.0, "count": 4},
+        )
+
+    def test_rebuild_repairs_drift_and_cached_responses(self):
+        MonthlyRollup.objects.filter(user=self.user).update(total=999)
+        url = "/api/transactions/summary/"
+        stale = self.client.get(url)
+        self.assertEqual(stale.json()["expense"], 1998.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_monthly_rollups", stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], stale["ETag"])
+        self.assertEqual(response.json()["expense"], 65.0)
+
+    def test_deleted_category_merges_into_uncategorized_row(self):
+        Transaction.objects.create(
+            user=self.user,
+            amount="20.00",
+            type=Transaction.EXPENSE,
+            category=self.category,
+            date=date(2026, 2, 5),
+        )
+        self.category.delete()
+        Transaction.objects.create(
+            user=self.user,
+            amount="5.00",
+            type=Transaction.EXPENSE,
+            date=date(2026, 2, 7),
+        )
+        expected = [
+            ("2026-01", "expense", 0, Decimal("40"), 1),
+            ("2026-01", "income", 0, Decimal("1000"), 1),
+            ("2026-02", "expense", 0, Decimal("50"), 4),
+        ]
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(monthly_statistics(self.user)["expense"], [40.0, 50.0])
+
+        call_command("rebuild_monthly_rollups", stdout=StringIO())
+        self.assertEqual(self.rollups(), expected)
+
+
+class KeysetPaginationTest(BaseTestCase):
+
+    def create(self, day):
+        return Transaction.objects.create(
+            user=self.user, amount=1, type="expense", date=date(2026, 1, day)
+        )
+
+    def test_walks_history_without_gaps_under_inserts(self):
+        for day in (2, 1, 2, 3, 2):
+            self.create(day)
+        expected = list(
+            Transaction.objects.filter(user=self.user)
+            .order_by("-date", "-id")
+            .values_list("pk", flat=True)
+        )
+
+        seen = []
+        url = "/api/transactions/?pagination=cursor&page_size=2"
+        while url:
+            with self.assertNumQueries(3):  # сессия, пользователь, страница
+                data = self.client.get(url).json()
+            self.assertNotIn("count", data)
+            seen += [item["id"] for item in data["results"]]
+            if len(seen) == 2:
+                self.create(5)  # новее курсора — не сдвигает страницы
+            url = data["next"]
+        self.assertEqual(seen, expected)
+
+    def test_page_numbers_stay_default_and_bad_cursor_is_404(self):
+        self.create(1)
+        data = self.client.get("/api/transactions/?page_size=1").json()
+        self.assertEqual(data["count"], 1)
+        response = self.client.get("/api/transactions/?cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+    def test_ordering_with_cursor_is_rejected(self):
+        self.create(1)
+        url = "/api/transactions/?pagination=cursor&ordering=-amount"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.json())
+        self.assertEqual(
+            self.client.get("/api/transactions/?ordering=-amount").status_code, 200
+        )
+
+
+class TransactionBatchTest(BaseTestCase):
+    URL = "/api/transactions/batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.kept, self.removed = (
+            Transaction.objects.create(
+                user=self.user,
+                amount=amount,
+                type="expense",
+                category=self.category,
+                date=date(2026, 1, 5),
+            )
+            for amount in (10, 20)
+        )
+
+    def post(self, data):
+        with patch("transactions.utils.schedule_budget_evaluation"):
+            return self.client.post(self.URL, data, content_type="application/json")
+
+    def aggregates(self):
+        return (
+            sorted(
+                SpendCounter.objects.exclude(amount=0).values_list(
+                    "category_id", "period", "period_start", "amount"
+                )
+            ),
+            sorted(
+                MonthlyRollup.objects.exclude(count=0).values_list(
+                    "month", "type", "category_id", "total", "count"
+                ),
+                key=str,
+            ),
+        )
+
+    def test_applies_batch_in_constant_queries(self):
+        def batch(count, day):
+            return {
+                "create": [
+                    {
+                        "amount": "5.00",
+                        "date": f"2026-01-{day:02d}",
+                        "category": self.category.pk,
+                    }
+                ]
+                * count
+            }
+
+        with CaptureQueriesContext(connection) as small:
+            self.post(batch(1, 6))
+        with CaptureQueriesContext(connection) as large:
+            self.post(batch(50, 7))
+        self.assertEqual(len(large), len(small))
+
+        response = self.post(
+            {
+                "create": [
+                    {"amount": "7.50", "date": "2026-02-01", "type": "income"},
+                ],
+                "update": [
+                    {"id": self.kept.pk, "amount": "12.00", "date": "2026-02-03"}
+                ],
+                "delete": [self.removed.pk],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["created"][0]["type_display"], "Income")
+        self.assertEqual(data["updated"][0]["category_name"], "Food")
+        self.assertEqual(data["deleted"], [self.removed.pk])
+        self.assertFalse(Transaction.objects.filter(pk=self.removed.pk).exists())
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.amount, Decimal("12.00"))
+        self.assertEqual(self.kept.fingerprint, self.kept.compute_fingerprint())
+
+        aggregates = self.aggregates()
+        call_command("rebuild_spend_counters", stdout=StringIO())
+        call_command("rebuild_monthly_rollups", stdout=StringIO())
+        self.assertEqual(self.aggregates(), aggregates)
+
+    def test_updates_write_only_their_own_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(
+                {
+                    "update": [
+                        {"id": self.kept.pk, "amount": "11.00"},
+                        {"id": self.removed.pk, "description": "Taxi"},
+                    ]
+                }
+            )
+        self.assertEqual(response.status_code, 200)
+        updates = [
+            query["sql"] for query in queries if query["sql"].startswith("UPDATE")
+        ]
+        table = Transaction._meta.db_table
+        updates = [sql for sql in updates if f'"{table}"' in sql.split("SET")[0]]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sum('"amount" =' in sql for sql in updates), 1)
+        if connection.features.has_select_for_update:
+            self.assertTrue(any("FOR UPDATE" in query["sql"] for query in queries))
+
+    def test_invalid_batch_writes_nothing(self):
+        foreign = Category.objects.create(name="Theirs", user=self.other_user)
+        theirs = Transaction.objects.create(
+            user=self.other_user, amount=1, type="expense", date=date(2026, 1, 5)
+        )
+        response = self.post(
+            {
+                "create": [
+                    {"amount": "1.00", "date": "2026-01-06"},
+                    {"amount": "0", "date": "2026-01-06", "category": foreign.pk},
+                ],
+                "update": [{"id": theirs.pk, "amount": "2.00"}],
+                "delete": [self.removed.pk, self.removed.pk],
+            }
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors["create"][0], {})
+        self.assertEqual(set(errors["create"][1]), {"amount", "category"})
+        self.assertEqual(errors["update"], [{"id": ["Not found."]}])
+        self.assertEqual(errors["delete"], [{}, {"id": ["Duplicate id."]}])
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+        too_many = {"delete": list(range(TransactionBatchSerializer.MAX_ITEMS + 1))}
+        self.assertEqual(self.post(too_many).status_code, 400)
+        self.assertEqual(self.post({}).status_code, 400)
+
+
+class SummaryTest(BaseTestCase):
+    URL = "/api/transactions/summary/"
+
+    def setUp(self):
+        super().setUp()
+        self.books = Category.objects.create(name="Books", user=self.user)
+        for amount, type_, category, day in (
+            (10, "expense", self.category, date(2026, 1, 5)),
+            (100, "income", None, date(2026, 1, 20)),
+            (5, "expense", self.category, date(2026, 2, 10)),
+            (7, "expense", self.books, date(2026, 2, 11)),
+        ):
+            Transaction.objects.create(
+                user=self.user, amount=amount, type=type_, category=category, date=day
+            )
+
+    def test_one_query_for_rollup_and_raw_ranges(self):
+        for date_from, expected in (
+            (date(2026, 1, 1), (100.0, 10.0, 90.0, 2)),  # целый месяц — MonthlyRollup
+            (date(2026, 1, 10), (100.0, 0.0, 100.0, 1)),  # часть месяца — Transaction
+        ):
+            with self.assertNumQueries(1):
+                summary = transaction_summary(
+                    self.user, date_from=date_from, date_to=date(2026, 1, 31)
+                )
+            self.assertEqual(
+                (
+                    summary["income"],
+                    summary["expense"],
+                    summary["balance"],
+                    summary["count"],
+                ),
+                expected,
+            )
+
+    def test_filters_and_category_breakdown(self):
+        data = self.client.get(
+            self.URL,
+            {"type": "expense", "split": "category", "date_from": "2026-01-02"},
+        ).json()
+        self.assertEqual((data["expense"], data["count"]), (22.0, 3))
+        self.assertEqual(
+            [
+                (row["category"], row["expense"], row["count"])
+                for row in data["categories"]
+            ],
+            [("Books", 7.0, 1), ("Food", 15.0, 2)],
+        )
+        data = self.client.get(self.URL, {"category": self.books.pk}).json()
+        self.assertEqual((data["balance"], data["count"]), (-7.0, 1))
+        self.assertEqual(self.client.get(self.URL, {"type": "bad"}).status_code, 400)
+
+    def test_cached_until_data_changes(self):
+        first = self.client.get(self.URL)
+        with self.assertNumQueries(2):  # сессия и пользователь, сводка из кэша
+            self.assertEqual(self.client.get(self.URL).json(), first.json())
+        self.assertEqual(
+            self.client.get(self.URL, HTTP_IF_NONE_MATCH=first["ETag"]).status_code,
+            304,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user, amount=1, type="income", date=date(2026, 3, 1)
+            )
+        self.assertEqual(self.client.get(self.URL).json()["income"], 101.0)
+
+
+class TimeSeriesTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for amount, type_, category, day in [
+            ("1000.00", Transaction.INCOME, None, date(2026, 1, 5)),
+            ("40.00", Transaction.EXPENSE, self.category, date(2026, 1, 6)),
+            ("10.00", Transaction.EXPENSE, None, date(2026, 1, 7)),
+            ("25.00", Transaction.EXPENSE, self.category, date(2026, 3, 2)),
+        ]:
+            Transaction.objects.create(
+                user=self.user, amount=amount, type=type_, category=category, date=day
+            )
+
+    def test_fills_gaps_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = time_series(self.user, "month", type_=Transaction.EXPENSE)
+        self.assertEqual(data["buckets"], ["2026-01-01", "2026-02-01", "2026-03-01"])
+        self.assertEqual(
+            data["series"], [{"type": "expense", "values": [50.0, 0.0, 25.0]}]
+        )
+
+        weeks = time_series(
+            self.user, "week", date(2026, 1, 1), date(2026, 1, 14), by_category=True
+        )
+        self.assertEqual(weeks["buckets"], ["2025-12-29", "2026-01-05", "2026-01-12"])
+        by_key = {(s["type"], s["category"]): s["values"] for s in weeks["series"]}
+        self.assertEqual(by_key[("expense", "Food")], [0.0, 40.0, 0.0])
+        self.assertEqual(by_key[("expense", None)], [0.0, 10.0, 0.0])
+        self.assertEqual(by_key[("income", None)], [0.0, 1000.0, 0.0])
+
+    def test_api_etag_and_validation(self):
+        url = "/api/transactions/timeseries/?granularity=year"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["buckets"], ["2026-01-01"])
+        self.assertIn("max-age", response["Cache-Control"])
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user,
+                amount="5.00",
+                type=Transaction.EXPENSE,
+                date=date(2026, 4, 1),
+            )
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+        bad = self.client.get("/api/transactions/timeseries/?granularity=hour")
+        self.assertEqual(bad.status_code, 400)
+        too_long = self.client.get(
+            "/api/transactions/timeseries/?granularity=day"
+            "&date_from=2000-01-01&date_to=2026-01-01"
+        )
+        self.assertEqual(too_long.status_code, 400)
+        one_sided = self.client.get(
+            "/api/transactions/timeseries/?granularity=day&date_from=0001-01-01"
+        )
+        self.assertEqual(one_sided.status_code, 400)
+
+
+class DataVersionTest(BaseTestCase):
+
+    def test_any_user_write_changes_keys_and_etags(self):
+        key = data_cache_key("report", self.user.id, "2026")
+        other_key = data_cache_key("report", self.other_user.id, "2026")
+        writes = [
+            lambda: Transaction.objects.create(
+                user=self.user,
+                amount="5.00",
+                type=Transaction.EXPENSE,
+                date=date(2026, 1, 1),
+            ),
+            lambda: Category.objects.create(user=self.user, name="Books"),
+            lambda: BudgetLimit.objects.create(
+                user=self.user, category=self.category, limit_amount=10, period="DAY"
+            ),
+            lambda: Category.objects.filter(user=self.user, name="Books").delete(),
+        ]
+        with patch("transactions.utils.schedule_budget_evaluation"):
+            for write in writes:
+                with self.captureOnCommitCallbacks(execute=True):
+                    write()
+                new_key = data_cache_key("report", self.user.id, "2026")
+                self.assertNotEqual(new_key, key)
+                self.assertNotEqual(data_etag(new_key), data_etag(key))
+                key = new_key
+
+        self.assertEqual(
+            data_cache_key("report", self.other_user.id, "2026"), other_key
+        )
+
+    def test_bulk_default_categories_bump_version(self):
+        version = data_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="fresh", password="x")
+        self.assertIsNotNone(data_version(user.id))
+        self.assertEqual(data_version(self.user.id), version)
+
+
+@skipUnless(get_redis_client(), "statistics hash requires the Redis cache backend")
+class CachedStatisticsTest(BaseTestCase):
+
+    def create(self, amount, day, type_=Transaction.EXPENSE):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                user=self.user,
+                amount=Decimal(amount),
+                type=type_,
+                category=self.category,
+                date=day,
+            )
+
+    def test_writes_patch_the_cached_hash(self):
+        self.create("100.00", date(2026, 1, 5), Transaction.INCOME)
+        self.assertEqual(get_statistics(self.user)["income"], [100.0])
+
+        later = self.create("30.25", date(2026, 2, 1))
+        with self.assertNumQueries(0):
+            data = get_statistics(self.user)
+        self.assertEqual(data["months"], ["2026-01", "2026-02"])
+        self.assertEqual(data["expense"], [0.0, 30.25])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            later.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_statistics(self.user)["months"], ["2026-01"])
+
+    def test_fill_between_commit_and_patch_is_not_double_counted(self):
+        self.create("10.00", date(2026, 1, 5))
+        get_statistics(self.user)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Transaction.objects.create(
+                user=self.user,
+                amount=Decimal("5.00"),
+                type=Transaction.EXPENSE,
+                date=date(2026, 1, 6),
+            )
+        # Пересчёт уже видит новую строку MonthlyRollup, а дельта ещё не дошла.
+        self.assertEqual(refresh_statistics(self.user)["expense"], [15.0])
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_statistics(self.user)["expense"], [15.0])
+        refresh_statistics(self.user)
+        self.assertEqual(get_statistics(self.user)["expense"], [15.0])
+
+    def test_rebuild_drops_cached_hash(self):
+        self.create("10.00", date(2026, 1, 5))
+        MonthlyRollup.objects.filter(user=self.user).update(total=999)
+        self.assertEqual(get_statistics(self.user)["expense"], [999.0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_monthly_rollups", stdout=StringIO())
+        self.assertEqual(get_statistics(self.user)["expense"], [10.0])
+
+    def test_version_mismatch_triggers_recompute(self):
+        self.create("10.00", date(2026, 1, 5))
+        get_statistics(self.user)
+        client = get_redis_client()
+        client.hset(stats_keys(self.user.id)[0], "__version__", "0")
+        with self.assertNumQueries(1):
+            self.assertEqual(get_statistics(self.user)["expense"], [10.0])
+
+    @patch("transactions.tasks.refresh_statistics_task.delay")
+    def test_stale_data_is_served_while_one_refresh_runs(self, delay):
+        self.create("10.00", date(2026, 1, 5))
+        get_statistics(self.user)
+        get_redis_client().hset(stats_keys(self.user.id)[0], "__fresh_until__", 0)
+
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(get_statistics(self.user)["expense"], [10.0])
+        delay.assert_called_once_with(self.user.id)
+
+
+class StatisticsViewTest(BaseTestCase):
+
+    def test_refresh_is_rate_limited(self):
+        url = reverse("transactions:statistics")
+        response = self.client.get(url, {"refresh": "true"}, follow=True)
+        self.assertRedirects(response, url)
+        self.assertContains(response, "Statistics refreshed.")
+
+        response = self.client.get(url, {"refresh": "true"}, follow=True)
+        self.assertContains(response, "refreshed less than a minute ago")
+
+
+class DeferredBudgetEvaluationTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        BudgetLimit.objects.create(
+            user=self.user,
+            category=self.category,
+            limit_amount=Decimal("100.00"),
+            period="MONTH",
+        )
+
+    def create_expense(self, amount):
+        return Transaction.objects.create(
+            user=self.user,
+            amount=Decimal(amount),
+            category=self.category,
+            type=Transaction.EXPENSE,
+            date=timezone.localdate(),
+        )
+
+    @patch("transactions.tasks.evaluate_user_budgets_task.apply_async")
+    def test_writes_are_coalesced_into_one_evaluation(self, apply_async):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                self.create_expense("10.00")
+        apply_async.assert_called_once_with(
+            args=[self.user.id], countdown=settings.BUDGET_EVALUATION_DEBOUNCE
+        )
+
+    @patch("transactions.tasks.deliver_budget_alerts_task.delay")
+    def test_task_queues_alert_and_clears_dirty_flag(self, delay):
+        self.create_expense("150.00")
+        cache.set(budget_dirty_key(self.user.id), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluate_user_budgets_task(self.user.id)
+        self.assertEqual(delay.call_count, 1)
+        self.assertIsNone(cache.get(budget_dirty_key(self.user.id)))
+
+    @override_settings(BUDGET_EVALUATION_MODE="sync")
+    @patch("transactions.tasks.deliver_budget_alerts_task.delay")
+    def test_sync_mode_checks_in_post_save(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_expense("150.00")
+        self.assertEqual(delay.call_count, 1)
+
+
+class BudgetAlertStateTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.budget = BudgetLimit.objects.create(
+            user=self.user,
+            category=self.category,
+            limit_amount=Decimal("100.00"),
+            period="MONTH",
+        )
+
+    def spend(self, amount, category=None):
+        return Transaction.objects.create(
+            user=self.user,
+            amount=Decimal(amount),
+            category=category or self.category,
+            type=Transaction.EXPENSE,
+            date=timezone.localdate(),
+        )
+
+    def test_notifies_only_on_upward_transition(self):
+        self.spend("85.00")
+        self.assertEqual(
+            [s.state for s in evaluate_budgets(self.user)], [BudgetAlertState.WARNING]
+        )
+        self.assertEqual(evaluate_budgets(self.user), [])
+
+        extra = self.spend("20.00")
+        self.assertEqual(
+            [s.state for s in evaluate_budgets(self.user)], [BudgetAlertState.EXCEEDED]
+        )
+
+        extra.delete()
+        self.assertEqual(evaluate_budgets(self.user), [])
+        self.spend("30.00")
+        self.assertEqual(evaluate_budgets(self.user), [])
+        state = BudgetAlertState.objects.get(budget=self.budget)
+        self.assertEqual(state.state, BudgetAlertState.EXCEEDED)
+        self.assertEqual(state.spent, Decimal("115.00"))
+
+    def test_delivery_sends_one_digest_per_user(self):
+        transport, _ = Category.objects.get_or_create(name="Transport", user=self.user)
+        BudgetLimit.objects.create(
+            user=self.user, category=transport, limit_amount=10, period="DAY"
+        )
+        self.spend("150.00")
+        self.spend("50.00", category=transport)
+        evaluate_budgets(self.user)
+
+        self.assertEqual(deliver_budget_alerts_task.apply().get(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Food", mail.outbox[0].body)
+        self.assertIn("Transport", mail.outbox[0].body)
+        self.assertFalse(BudgetAlertState.objects.filter(notify_pending=True).exists())
+        self.assertEqual(deliver_budget_alerts_task.apply().get(), 0)
+
+    @patch("transactions.tasks.deliver_budget_alerts_task.delay")
+    def test_deprecated_email_task_forwards_to_digest(self, delay):
+        self.spend("150.00")
+        alert = {"category": "Food", "period": "MONTH", "spent": 150.0}
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                send_budget_alert_email_task(self.user.email, self.user.username, alert)
+        delay.assert_called_once()
+        state = BudgetAlertState.objects.get(budget=self.budget)
+        self.assertEqual(state.state, BudgetAlertState.EXCEEDED)
+        self.assertTrue(state.notify_pending)
+        self.assertEqual(mail.outbox, [])
+
+    def test_escalation_during_delivery_stays_pending(self):
+        self.spend("85.00")
+        evaluate_budgets(self.user)
+
+        def escalate(messages):
+            BudgetAlertState.objects.update(
+                state=BudgetAlertState.EXCEEDED,
+                notified_state=BudgetAlertState.EXCEEDED,
+                notify_pending=True,
+            )
+            return len(messages)
+
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=escalate,
+        ):
+            self.assertEqual(deliver_budget_alerts_task.apply().get(), 1)
+        state = BudgetAlertState.objects.get(budget=self.budget)
+        self.assertTrue(state.notify_pending)
+
+        deliver_budget_alerts_task.apply()
+        self.assertIn("exceeded", mail.outbox[-1].subject)
+
+
+class BudgetSweepTest(BaseTestCase):
+
+    def add_user_over_budget(self, username):
+        user = User.objects.create_user(username=username, password="x")
+        category = Category.objects.get(name="Food", user=user)
+        BudgetLimit.objects.create(
+            user=user, category=category, limit_amount=10, period="WEEK"
+        )
+        Transaction.objects.create(
+            user=user,
+            amount=Decimal("25.00"),
+            category=category,
+            type=Transaction.EXPENSE,
+            date=timezone.localdate(),
+        )
+
+    def sweep_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = sweep_budget_periods(chunk_size=50)
+        return report, len(queries)
+
+    @patch("transactions.tasks.deliver_budget_alerts_task.delay")
+    def test_query_count_does_not_grow_with_users(self, delay):
+        for i in range(2):
+            self.add_user_over_budget(f"sweep{i}")
+        report, queries = self.sweep_queries()
+        self.assertEqual((report["users"], report["transitions"]), (2, 2))
+
+        for i in range(2, 6):
+            self.add_user_over_budget(f"sweep{i}")
+        report, more_queries = self.sweep_queries()
+        self.assertEqual((report["users"], report["transitions"]), (6, 4))
+        self.assertEqual(queries, more_queries)
+        self.assertIsNotNone(report["users_per_second"])
+
+
+class BudgetForecastTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport, _ = Category.objects.get_or_create(
+            name="Transport", user=self.user
+        )
+        self.monthly = BudgetLimit.objects.create(
+            user=self.user, category=self.category, limit_amount=300, period="MONTH"
+        )
+        self.weekly = BudgetLimit.objects.create(
+            user=self.user, category=self.transport, limit_amount=60, period="WEEK"
+        )
+        for category, day, amount in [
+            (self.category, 2, "50.00"),
+            (self.category, 5, "50.00"),
+            (self.transport, 9, "40.00"),
+            (self.transport, 10, "30.00"),
+        ]:
+            Transaction.objects.create(
+                user=self.user,
+                amount=Decimal(amount),
+                category=category,
+                type=Transaction.EXPENSE,
+                date=date(2026, 3, day),
+            )
+
+    def test_projection_and_exceed_dates(self):
+        forecasts = {
+            f["id"]: f for f in forecast_budgets(self.user, today=date(2026, 3, 10))
+        }
+        monthly = forecasts[self.monthly.pk]
+        self.assertEqual(monthly["daily_rate"], 10.0)
+        self.assertEqual(monthly["projected"], 310.0)
+        self.assertEqual(monthly["exceeds_on"], "2026-03-30")
+
+        weekly = forecasts[self.weekly.pk]
+        self.assertEqual(weekly["spent"], 70.0)
+        self.assertEqual(weekly["period_end"], "2026-03-15")
+        self.assertEqual(weekly["exceeds_on"], "2026-03-10")
+
+    def test_api_and_budget_list(self):
+        response = self.client.get("/api/budgets/forecast/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get(reverse("transactions:budget-list"))
+        self.assertContains(response, "Projected:")
+
+
+class BudgetAlertsCacheTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        BudgetLimit.objects.create(
+            user=self.user,
+            category=self.category,
+            limit_amount=Decimal("100.00"),
+            period="MONTH",
+        )
+        self.other_category, _ = Category.objects.get_or_create(
+            name="Transport", user=self.user
+        )
+
+    @patch("transactions.utils.schedule_budget_evaluation")
+    def spend(self, category, schedule, date=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user,
+                amount=Decimal("90.00"),
+                category=category,
+                type=Transaction.EXPENSE,
+                date=date or timezone.localdate(),
+            )
+
+    def test_second_read_is_a_hit(self):
+        self.assertEqual(get_budget_alerts(self.user), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_budget_alerts(self.user), [])
+        self.assertEqual(budget_alerts_cache_stats()["hit_rate"], 0.5)
+
+    def test_only_relevant_writes_invalidate(self):
+        get_budget_alerts(self.user)
+        self.spend(self.other_category)
+        self.spend(self.category, date=timezone.localdate() - timedelta(days=400))
+        self.assertEqual(get_budget_alerts(self.user), [])
+
+        self.spend(self.category)
+        self.assertEqual(len(get_budget_alerts(self.user)), 1)
+
+    def test_window_rolls_over_with_the_date(self):
+        self.spend(self.category)
+        self.assertEqual(len(get_budget_alerts(self.user)), 1)
+        next_month = get_period_start("MONTH") + timedelta(days=32)
+        with patch("django.utils.timezone.localdate", return_value=next_month):
+            self.assertEqual(get_budget_alerts(self.user), [])
+
 
 # ─── Views ────────────────────────────────────────────────────────────────────
 
@@ -274,16 +1280,486 @@ class ExportTransactionsViewTest(BaseTestCase):
         response = self.client.get(reverse("transactions:export"))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Type"], "text/csv")
-        content = response.content.decode()
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
         self.assertIn("Date", content)
         self.assertIn("100", content)
 
+    def test_export_applies_list_filters(self):
+        for day, type_ in (
+            (1, Transaction.EXPENSE),
+            (2, Transaction.INCOME),
+            (3, Transaction.EXPENSE),
+        ):
+            Transaction.objects.create(
+                user=self.user,
+                amount=day,
+                type=type_,
+                category=self.category if day == 3 else None,
+                date=date(2026, 1, day),
+                description=f'Say "{day}", twice',
+            )
+        Transaction.objects.create(
+            user=self.other_user, amount=5, type="expense", date=date(2026, 1, 3)
+        )
+        response = self.client.get(
+            reverse("transactions:export"),
+            {"type": "expense", "date_from": "2026-01-01"},
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            [
+                "Date,Amount,Type,Category,Description",
+                '2026-01-03,3.00,Expense,Food,"Say ""3"", twice"',
+                '2026-01-01,1.00,Expense,,"Say ""1"", twice"',
+            ],
+        )
+
+    def test_copy_export_matches_orm(self):
+        if not copy_export_supported():
+            self.assertEqual(resolve_export_mode("copy"), "orm")
+            self.skipTest("COPY export requires PostgreSQL")
+        for day in range(1, 6):
+            Transaction.objects.create(
+                user=self.user,
+                amount=Decimal("1.50") * day,
+                type=Transaction.EXPENSE if day % 2 else Transaction.INCOME,
+                category=self.category if day % 3 else None,
+                date=date(2026, 1, day // 2 + 1),
+                description=["", "plain", 'with "quotes", commas', "line\nbreak"][
+                    day % 4
+                ],
+            )
+        transactions = Transaction.objects.filter(user=self.user)
+        copied = b"".join(copy_csv_chunks(transactions, chunk_size=2)).decode()
+        streamed = "".join(
+            stream_csv(export_rows(transactions.order_by("-date", "-id")))
+        )
+        self.assertEqual(copied, streamed.replace("\r\n", "\n"))
+
     def test_export_requires_login(self):
         self.client.logout()
         response = self.client.get(reverse("transactions:export"))
         self.assertEqual(response.status_code, 401)
 
 
+def csv_upload(rows):
+    header = "Date,Amount,Type,Category,Description\n"
+    return SimpleUploadedFile(
+        "import.csv", (header + "\n".join(rows)).encode(), "text/csv"
+    )
+
+
+class ImportTransactionsTest(BaseTestCase):
+
+    def test_bulk_import_validates_and_updates_aggregates(self):
+        rows = [
+            "2026-01-05,10.00,expense,Food,Lunch",
+            "2026-01-06,20.00,Expense,Books,Novel",
+            "2026-01-07,1000,income,,Salary",
+            "2026-13-01,5,expense,Food,",
+            "2026-01-08,-5,expense,Food,",
+            "2026-01-09,abc,transfer,Food,",
+        ]
+        with patch("transactions.utils.schedule_budget_evaluation"):
+            result = import_transactions_from_csv(csv_upload(rows), self.user)
+
+        self.assertEqual(result["created"], 3)
+        self.assertEqual(
+            result["errors"],
+            [
+                "Row 5: invalid date '2026-13-01' (expected YYYY-MM-DD)",
+                "Row 6: amount must be greater than zero",
+                "Row 7: invalid amount 'abc'",
+                "Row 7: invalid type 'transfer' (expected 'income' or 'expense')",
+            ],
+        )
+        self.assertIn("rows_per_second", result)
+        books = Category.objects.get(user=self.user, name="Books")
+        self.assertEqual(
+            Transaction.objects.get(description="Novel").category_id, books.pk
+        )
+        self.assertEqual(
+            SpendCounter.objects.get(category=self.category, period="MONTH").amount,
+            Decimal("10.00"),
+        )
+        self.assertEqual(MonthlyRollup.objects.filter(user=self.user).count(), 3)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def rows(prefix, count):
+            return [
+                f"2026-01-{day % 28 + 1:02d},1.00,expense,{prefix} {day % 3},{prefix}"
+                for day in range(count)
+            ]
+
+        with CaptureQueriesContext(connection) as small:
+            import_transactions_from_csv(csv_upload(rows("A", 4)), self.user)
+        with CaptureQueriesContext(connection) as large:
+            import_transactions_from_csv(
+                csv_upload(rows("B", 120)), self.user, batch_size=200
+            )
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 124)
+
+    @patch("transactions.utils.schedule_budget_evaluation")
+    def test_reimport_skips_existing_rows(self, schedule):
+        rows = [
+            "2026-01-05,10.00,expense,Food,Lunch",
+            "2026-01-05,10.00,expense,Food,Lunch",  # две одинаковые покупки
+            "2026-01-06,20.00,income,,Salary",
+        ]
+        result = import_transactions_from_csv(csv_upload(rows), self.user)
+        self.assertEqual((result["created"], result["skipped"]), (3, 0))
+
+        rows += ["2026-01-05,10,Expense,Food,  lunch ", "2026-01-07,5.00,expense,,"]
+        result = import_transactions_from_csv(csv_upload(rows), self.user, batch_size=2)
+        self.assertEqual((result["created"], result["skipped"]), (1, 4))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(
+            SpendCounter.objects.get(category=self.category, period="MONTH").amount,
+            Decimal("20.00"),
+        )
+
+    def test_fingerprint_follows_edits(self):
+        transaction = Transaction.objects.create(
+            user=self.user,
+            amount=Decimal("10.00"),
+            type=Transaction.EXPENSE,
+            date=date(2026, 1, 5),
+            description="Lunch",
+        )
+        self.assertEqual(
+            transaction.fingerprint,
+            transaction_fingerprint(
+                self.user.pk, date(2026, 1, 5), "10", "expense", " LUNCH"
+            ),
+        )
+        transaction.description = "Dinner"
+        transaction.save(update_fields=["description"])
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.fingerprint, transaction.compute_fingerprint())
+
+    @patch("transactions.utils.schedule_budget_evaluation")
+    def test_collapse_duplicates_command(self, schedule):
+        rows = ["2026-01-05,10.00,expense,Food,Lunch"] * 3 + [
+            "2026-01-06,20.00,expense,Food,Dinner"
+        ]
+        import_transactions_from_csv(csv_upload(rows), self.user)
+        import_transactions_from_csv(csv_upload(rows[:1]), self.other_user)
+        first = Transaction.objects.filter(user=self.user).earliest("pk")
+        # Одинаковые строки одного файла — не повтор.
+        out = StringIO()
+        call_command("collapse_duplicate_transactions", apply=True, stdout=out)
+        self.assertIn("Deleted 0 duplicate", out.getvalue())
+
+        # Повтор, пришедший с другим импортом, по умолчанию только считается.
+        later = Transaction.objects.filter(user=self.user, description="Lunch")
+        later.filter(pk=later.latest("pk").pk).update(import_batch="later")
+        call_command("collapse_duplicate_transactions", stdout=out)
+        self.assertIn("Found 1 duplicate", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 5)
+
+        call_command("collapse_duplicate_transactions", apply=True, stdout=out)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 3)
+        call_command(
+            "collapse_duplicate_transactions",
+            apply=True,
+            include_same_batch=True,
+            batch_size=1,
+            stdout=out,
+        )
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(Transaction.objects.filter(pk=first.pk).exists())
+        self.assertEqual(
+            SpendCounter.objects.get(category=self.category, period="MONTH").amount,
+            Decimal("30.00"),
+        )
+        rollup = MonthlyRollup.objects.get(user=self.user, type=Transaction.EXPENSE)
+        self.assertEqual((rollup.total, rollup.count), (Decimal("30.00"), 2))
+
+    def test_streams_in_batches_and_rolls_back_on_bad_encoding(self):
+        rows = [f"2026-01-0{day},1.00,expense,Food,Row" for day in range(1, 6)]
+        with patch("transactions.importers.resolve_categories") as resolve:
+            resolve.return_value = {"Food": self.category.pk}
+            result = import_transactions_from_csv(
+                csv_upload(rows), self.user, batch_size=2
+            )
+        self.assertEqual(result["created"], 5)
+        resolve.assert_called_once()
+
+        broken = csv_upload(rows * 100)  # больше буфера декодера
+        broken.file.seek(0, 2)
+        broken.file.write(b"\n2026-01-09,1.00,expense,Caf\xe9,Row\n")
+        broken.file.seek(0)
+        result = import_transactions_from_csv(broken, self.user, batch_size=2)
+        self.assertEqual(result["created"], 0)
+        self.assertEqual(result["errors"], ["File encoding error. Please use UTF-8."])
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 5)
+
+    @override_settings(CSV_IMPORT_MAX_UPLOAD_MB=1)
+    def test_form_upload_cap_comes_from_settings(self):
+        big = SimpleUploadedFile("big.csv", b"x" * (1024 * 1024 + 1), "text/csv")
+        form = CSVImportForm(files={"csv_file": big})
+        self.assertFalse(form.is_valid())
+        self.assertIn("1MB", form.errors["csv_file"][0])
+
+
+class ImportModeTest(BaseTestCase):
+    ROWS = [
+        "2026-01-05, 10.00 ,expense,Food,Lunch",
+        "2026-1-6,20.005,EXPENSE, Books ,Novel",
+        "2026-01-07,1000,income,,Salary",
+        "2026-02-30,5,expense,Food,",
+        "2026-01-08,0,expense,Food,",
+        "2026-01-09,abc,transfer,Food,",
+        "2026-01-10,100000000,expense,Food,",
+        f"2026-01-11,1,expense,{'x' * 101},",
+        "\u00a02026-01-12\u00a0,1_000,Expense\u00a0,Food,Nbsp",
+    ]
+
+    def import_rows(self, user, mode, workers=None):
+        with patch("transactions.utils.schedule_budget_evaluation"):
+            result = import_transactions_from_csv(
+                csv_upload(self.ROWS), user, batch_size=3, mode=mode, workers=workers
+            )
+        ledger = sorted(
+            (t.date, t.amount, t.type, t.category.name if t.category else None)
+            for t in Transaction.objects.filter(user=user).select_related("category")
+        )
+        counters = sorted(
+            (c.category.name, c.period, c.period_start, c.amount)
+            for c in SpendCounter.objects.filter(user=user).select_related("category")
+        )
+        return result, ledger, counters
+
+    def test_copy_falls_back_to_orm_without_postgres(self):
+        result, ledger, _ = self.import_rows(self.user, "auto")
+        self.assertEqual(result["mode"], resolve_import_mode())
+        self.assertEqual((result["created"], result["failed"]), (4, 5))
+        self.assertIn("Row 8: amount must be less than 100000000", result["errors"])
+        self.assertIn(
+            "Row 9: category name is longer than 100 characters", result["errors"]
+        )
+        if not copy_import_supported():
+            self.assertEqual(resolve_import_mode("copy"), "orm")
+
+    def test_parallel_validation_matches_sequential(self):
+        sequential = self.import_rows(self.user, "orm")
+        parallel = self.import_rows(self.other_user, "orm", workers=2)
+        self.assertEqual(parallel[0]["workers"], 2)
+        for key in ("created", "failed", "errors"):
+            self.assertEqual(parallel[0][key], sequential[0][key])
+        self.assertEqual(parallel[1:], sequential[1:])
+
+        # Процессы prefork-воркера Celery — демоны: пул там не запустить.
+        with patch("multiprocessing.current_process") as current_process:
+            current_process.return_value.daemon = True
+            self.assertEqual(resolve_import_workers(2), 1)
+
+    def test_copy_matches_orm(self):
+        if not copy_import_supported():
+            self.skipTest("COPY import requires PostgreSQL 16+")
+        orm = self.import_rows(self.user, "orm")
+        copy = self.import_rows(self.other_user, "copy")
+        self.assertEqual(copy[0]["mode"], "copy")
+        for key in ("created", "failed", "errors"):
+            self.assertEqual(copy[0][key], orm[0][key])
+        self.assertEqual(copy[1:], orm[1:])
+        self.assertTrue(
+            all(
+                t.fingerprint == t.compute_fingerprint()
+                for t in Transaction.objects.filter(user=self.other_user)
+            )
+        )
+        again = self.import_rows(self.other_user, "copy")
+        self.assertEqual((again[0]["created"], again[0]["skipped"]), (0, 4))
+
+    def test_staging_rows_share_python_normalisation(self):
+        self.assertEqual(
+            staging_row(
+                2,
+                {
+                    "Date": "\u00a02026-1-6 ",
+                    "Amount": "1_000.005",
+                    "Type": "Expense\u00a0",
+                    "Category": " Books ",
+                    "Description": "  Novel\u00a0",
+                },
+            )[:7],
+            (2, "2026-01-06", "1000.01", "expense", "Books", "Novel", "novel"),
+        )
+        self.assertEqual(
+            staging_row(3, {"Date": "2026-02-30", "Amount": "1e400"})[1:3],
+            ("2026-02-30", "1e400"),
+        )
+
+    def test_errors_quote_raw_values_in_both_modes(self):
+        rows = [" 2026-13-01 ,  abc ,FOO,Food,", "2026-01-05,1,\u00a0Transfer ,,"]
+        expected = [
+            "Row 2: invalid date ' 2026-13-01 ' (expected YYYY-MM-DD)",
+            "Row 2: invalid amount '  abc '",
+            "Row 2: invalid type 'FOO' (expected 'income' or 'expense')",
+            "Row 3: invalid type '\u00a0Transfer ' (expected 'income' or 'expense')",
+        ]
+        modes = ["orm", "copy"] if copy_import_supported() else ["orm"]
+        for mode in modes:
+            result = import_transactions_from_csv(
+                csv_upload(rows), self.user, mode=mode
+            )
+            self.assertEqual(result["errors"], expected)
+
+    def test_reimport_does_not_recreate_deleted_categories(self):
+        modes = ["orm", "copy"] if copy_import_supported() else ["orm"]
+        for mode, user in zip(modes, (self.user, self.other_user)):
+            self.import_rows(user, mode)
+            Category.objects.filter(user=user, name="Books").delete()
+            result = self.import_rows(user, mode)[0]
+            self.assertEqual(result["created"], 0)
+            self.assertFalse(Category.objects.filter(user=user, name="Books").exists())
+
+    def test_benchmark_command_rolls_back(self):
+        out = StringIO()
+        users = User.objects.count()
+        call_command("benchmark_import", rows=50, mode="both", stdout=out)
+        self.assertIn("orm (workers=1): ", out.getvalue())
+        self.assertEqual(User.objects.count(), users)
+        self.assertFalse(Transaction.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportJobTest(BaseTestCase):
+
+    def upload(self, content):
+        return SimpleUploadedFile(
+            "import.csv",
+            b"Date,Amount,Type,Category,Description\n" + content,
+            "text/csv",
+        )
+
+    def post(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("transactions:import"),
+                {"csv_file": self.upload(content)},
+                follow=True,
+            )
+
+    @patch("transactions.tasks.import_csv_task.delay")
+    def test_upload_queues_job_once_per_file(self, delay):
+        response = self.post(b"2026-01-05,10.00,expense,Food,Lunch\n")
+        job = ImportJob.objects.get(user=self.user)
+        self.assertRedirects(response, job.get_absolute_url())
+        delay.assert_called_once_with(job.pk)
+
+        response = self.post(b"2026-01-05,10.00,expense,Food,Lunch\n")
+        self.assertContains(response, "This file has already been uploaded.")
+        self.assertEqual(ImportJob.objects.count(), 1)
+        delay.assert_called_once()
+
+        # Упавшее задание не мешает загрузить тот же файл снова.
+        ImportJob.objects.update(status=ImportJob.FAILED)
+        self.post(b"2026-01-05,10.00,expense,Food,Lunch\n")
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    @patch("transactions.utils.schedule_budget_evaluation")
+    @patch("transactions.tasks.import_csv_task.delay")
+    def test_stale_running_job_is_reclaimed_or_failed(self, delay, schedule):
+        content = b"2026-01-05,10.00,expense,Food,Lunch\n"
+        job, _ = create_import_job(self.user, self.upload(content))
+        long_ago = timezone.now() - timedelta(minutes=settings.JOB_STALE_MINUTES + 1)
+        ImportJob.objects.update(
+            status=ImportJob.RUNNING, started_at=long_ago, task_id="task-1"
+        )
+        job.refresh_from_db()
+
+        # Долгий импорт со свежим пульсом не трогается.
+        heartbeat(job)
+        self.assertIsNone(run_import_job(job.pk))
+        self.assertEqual(fail_stale_import_jobs(), 0)
+        # Повторная доставка той же задачи ждёт, пока пульс устареет.
+        delay_seconds = reclaim_delay(ImportJob, job.pk, "task-1")
+        self.assertGreater(delay_seconds, settings.JOB_STALE_MINUTES * 60 - 5)
+        self.assertIsNone(reclaim_delay(ImportJob, job.pk, "task-2"))
+
+        cache.delete(heartbeat_key(job))
+        self.assertEqual(run_import_job(job.pk, task_id="task-1")["created"], 1)
+
+        ImportJob.objects.update(status=ImportJob.RUNNING, started_at=long_ago)
+        self.post(content)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    @patch("transactions.utils.schedule_budget_evaluation")
+    @patch("transactions.tasks.import_csv_task.delay")
+    def test_run_job_records_results(self, delay, schedule):
+        job, created = create_import_job(
+            self.user, self.upload(b"2026-01-05,10.00,expense,Food,Lunch\nbad,1,x,,\n")
+        )
+        self.assertTrue(created)
+        run_import_job(job.pk)
+        self.assertIsNone(run_import_job(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual((job.rows_created, job.rows_failed), (1, 1))
+        self.assertFalse(job.file)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+
+        status = self.client.get(
+            reverse("transactions:import-job-status", args=[job.pk])
+        ).json()
+        self.assertEqual(status["rows_processed"], 2)
+        self.assertTrue(status["finished"])
+        page = self.client.get(job.get_absolute_url())
+        self.assertContains(page, "Row 3: invalid date")
+        self.assertEqual(job.error_count, 2)
+        self.assertTrue(job.error_report)
+
+        self.client.login(username="otheruser", password="testpass123")
+        self.assertEqual(self.client.get(job.get_absolute_url()).status_code, 404)
+
+    @patch("transactions.tasks.import_csv_task.delay")
+    def test_errors_are_capped_and_downloadable(self, delay):
+        job, _ = create_import_job(
+            self.user, self.upload(b"bad,1.00,expense,,\n" * 150)
+        )
+        run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((len(job.errors), job.error_count), (100, 150))
+
+        page = self.client.get(job.get_absolute_url())
+        self.assertContains(page, "150 errors, first 100 shown")
+        response = self.client.get(job.error_report_url)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 150)
+        self.assertEqual(
+            lines[-1], b"Row 151: invalid date 'bad' (expected YYYY-MM-DD)"
+        )
+
+        self.client.login(username="otheruser", password="testpass123")
+        self.assertEqual(self.client.get(job.error_report_url).status_code, 404)
+
+    def test_status_reports_progress_and_eta(self):
+        job = ImportJob.objects.create(
+            user=self.user,
+            file_name="big.csv",
+            file_hash="0" * 64,
+            file_size=1000,
+            status=ImportJob.RUNNING,
+            started_at=timezone.now() - timedelta(seconds=10),
+        )
+        cache.set(
+            import_progress_key(job.pk),
+            {"created": 90, "failed": 10, "bytes_read": 250},
+        )
+        status = import_job_status(job)
+        self.assertEqual(status["rows_processed"], 100)
+        self.assertEqual(status["percent"], 25.0)
+        self.assertEqual(status["eta_seconds"], 30)
+
+
 # ─── Forms ────────────────────────────────────────────────────────────────────
 
 
@@ -353,3 +1829,125 @@ class BudgetLimitFormTest(BaseTestCase):
             user=self.user,
         )
         self.assertFalse(form.is_valid())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportJobTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for day, type_ in ((1, Transaction.EXPENSE), (2, Transaction.INCOME)):
+            Transaction.objects.create(
+                user=self.user,
+                amount=day,
+                type=type_,
+                category=self.category,
+                date=date(2026, 1, day),
+                description="Кофе",
+            )
+
+    def post(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("transactions:export-start"), data)
+
+    def download(self, job):
+        response = self.client.get(
+            reverse("transactions:export-job-download", args=[job.pk])
+        )
+        return gzip.decompress(b"".join(response.streaming_content)).decode()
+
+    @patch("transactions.tasks.export_transactions_task.delay")
+    def test_export_job_writes_gzip_and_is_reused(self, delay):
+        response = self.post(format="ndjson", type="expense", page="2")
+        job = ExportJob.objects.get(user=self.user)
+        self.assertRedirects(response, job.get_absolute_url())
+        self.assertEqual(job.filters, {"type": "expense"})
+        delay.assert_called_once_with(job.pk)
+        self.assertEqual(
+            self.client.get(
+                reverse("transactions:export-job-download", args=[job.pk])
+            ).status_code,
+            404,
+        )
+
+        run_export_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows), (ExportJob.DONE, 1))
+        self.assertIsNotNone(job.duration)
+        self.assertEqual(
+            [json.loads(line) for line in self.download(job).splitlines()],
+            [
+                {
+                    "date": "2026-01-01",
+                    "amount": "1.00",
+                    "type": "Expense",
+                    "category": "Food",
+                    "description": "Кофе",
+                }
+            ],
+        )
+        self.assertContains(self.client.get(job.get_absolute_url()), "Download")
+
+        # Тот же запрос при неизменных данных — тот же файл.
+        self.post(format="ndjson", type="expense")
+        self.assertEqual(ExportJob.objects.count(), 1)
+        delay.assert_called_once()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user, amount=3, type="expense", date=date(2026, 1, 3)
+            )
+        self.post(format="ndjson", type="expense")
+        fresh = ExportJob.objects.latest("pk")
+        self.assertNotEqual(fresh.pk, job.pk)
+        run_export_job(fresh.pk)
+        self.assertEqual(list(ExportJob.objects.all()), [fresh])
+
+        self.client.login(username="otheruser", password="testpass123")
+        self.assertEqual(self.client.get(fresh.get_absolute_url()).status_code, 404)
+
+    @patch("transactions.tasks.export_transactions_task.delay")
+    def test_stale_running_export_is_reclaimed_or_failed(self, delay):
+        self.post(format="csv")
+        job = ExportJob.objects.get(user=self.user)
+        long_ago = timezone.now() - timedelta(minutes=settings.JOB_STALE_MINUTES + 1)
+        ExportJob.objects.update(
+            status=ExportJob.RUNNING, started_at=long_ago, task_id="task-1"
+        )
+        job.refresh_from_db()
+
+        heartbeat(job)
+        self.assertIsNone(run_export_job(job.pk))
+        self.assertIsNotNone(reclaim_delay(ExportJob, job.pk, "task-1"))
+        cache.delete(heartbeat_key(job))
+        self.assertEqual(run_export_job(job.pk, task_id="task-1")["rows"], 2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertIsNone(cache.get(heartbeat_key(job)))
+
+        # Зависшая выгрузка не мешает повторить тот же запрос.
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user, amount=3, type="expense", date=date(2026, 1, 3)
+            )
+        self.post(format="csv")
+        stuck = ExportJob.objects.latest("pk")
+        ExportJob.objects.filter(pk=stuck.pk).update(
+            status=ExportJob.RUNNING, started_at=long_ago
+        )
+        self.post(format="csv")
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.status, ExportJob.FAILED)
+        self.assertEqual(ExportJob.objects.latest("pk").status, ExportJob.PENDING)
+        self.assertEqual(delay.call_count, 3)
+
+    @patch("transactions.tasks.export_transactions_task.delay")
+    def test_csv_export_job_matches_streaming_export(self, delay):
+        self.post(format="csv")
+        job = ExportJob.objects.get(user=self.user)
+        run_export_job(job.pk)
+        streamed = self.client.get(reverse("transactions:export"))
+        self.assertEqual(
+            self.download(job),
+            b"".join(streamed.streaming_content).decode(),
+        )
@@ -26,6 +26,17 @@ urlpatterns = [
     path("transactions/", views.TransactionListView.as_view(), name="list"),
     path("transactions/add/", views.CreateTransactionView.as_view(), name="create"),
     path("transactions/import/", views.import_transactions, name="import"),
+    path("imports/<int:pk>/", views.import_job_detail, name="import-job"),
+    path(
+        "imports/<int:pk>/status/",
+        views.import_job_status_view,
+        name="import-job-status",
+    ),
+    path(
+        "imports/<int:pk>/errors/",
+        views.import_job_errors,
+        name="import-job-errors",
+    ),
     path(
         "transactions/<int:pk>/",
         views.TransactionDetailView.as_view(),
@@ -42,6 +53,13 @@ urlpatterns = [
         name="category_detail",
     ),
     path("export-transactions/", views.export_transactions, name="export"),
+    path("exports/", views.start_export, name="export-start"),
+    path("exports/<int:pk>/", views.export_job_detail, name="export-job"),
+    path(
+        "exports/<int:pk>/download/",
+        views.export_job_download,
+        name="export-job-download",
+    ),
     path("statistics/", views.statistics_view, name="statistics"),
     path("budgets/", views.BudgetLimitListView.as_view(), name="budget-list"),
     path("budgets/add/", views.BudgetLimitCreateView.as_view(), name="budget-add"),
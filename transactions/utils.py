@@ -1,15 +1,22 @@
-import csv
-import io
-from datetime import datetime, timedelta
-from decimal import Decimal, InvalidOperation
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-from django.db.models import Sum
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DateField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from .models import BudgetLimit, Category, Transaction
+from .models import BudgetAlertState, BudgetLimit, SpendCounter
 
+logger = logging.getLogger(__name__)
 
-def get_period_start(period):
-    today = datetime.now().date()
+
+def get_period_start(period, today=None):
+    today = today or timezone.localdate()
     if period == "DAY":
         return today
     elif period == "WEEK":
@@ -19,108 +26,215 @@ def get_period_start(period):
     return today
 
 
+def get_period_starts(today=None):
+    """Начала текущих периодов DAY/WEEK/MONTH — считаются один раз на вызов."""
+    today = today or timezone.localdate()
+    return {
+        period: get_period_start(period, today)
+        for period, _ in BudgetLimit.PERIOD_CHOICES
+    }
+
+
+def annotate_budget_spend(budgets, period_starts):
+    """
+    Добавляет к queryset лимитов начало текущего окна (period_start)
+    и сумму расходов в нём (spent) из SpendCounter — одним запросом,
+    чтение счётчика идёт по его уникальному ключу.
+    """
+    period_start = Case(
+        *[
+            When(period=period, then=Value(start))
+            for period, start in period_starts.items()
+        ],
+        output_field=DateField(),
+    )
+    counter = SpendCounter.objects.filter(
+        user=OuterRef("user"),
+        category=OuterRef("category"),
+        period=OuterRef("period"),
+        period_start=OuterRef("period_start"),
+    ).values("amount")[:1]
+    return budgets.annotate(period_start=period_start).annotate(
+        spent=Coalesce(Subquery(counter), Value(Decimal("0"))),
+        category_name=F("category__name"),
+    )
+
+
+def build_budget_alert(budget):
+    limit = float(budget.limit_amount)
+    spent = float(budget.spent)
+    percentage = round((spent / limit) * 100, 1) if limit > 0 else 0
+    return {
+        "category": budget.category_name,
+        "spent": spent,
+        "limit": limit,
+        "period": budget.get_period_display(),
+        "percentage": percentage,
+        "is_exceeded": spent >= limit,
+        "is_warning": percentage >= 80,
+    }
+
+
 def check_budget_limits(user):
-    budgets = BudgetLimit.objects.filter(user=user)
-    alerts = []
+    budgets = annotate_budget_spend(
+        BudgetLimit.objects.filter(user=user), get_period_starts()
+    ).order_by("pk")
+    return [build_budget_alert(budget) for budget in budgets if budget.spent > 0]
+
+
+def alert_state_for(alert):
+    if alert["is_exceeded"]:
+        return BudgetAlertState.EXCEEDED
+    if alert["is_warning"]:
+        return BudgetAlertState.WARNING
+    return BudgetAlertState.OK
+
+
+def sync_alert_states(budgets):
+    """
+    Сверяет состояния лимитов с посчитанными тратами.
+
+    budgets — результат annotate_budget_spend (любого числа пользователей).
+    Один SELECT, один bulk_create и один bulk_update на весь список.
+    Возвращает состояния, которые поднялись выше уже отправленного уровня
+    и ждут письма.
+    """
+    levels = BudgetAlertState.LEVELS
+    existing = {
+        (state.budget_id, state.period_start): state
+        for state in BudgetAlertState.objects.filter(
+            budget_id__in=[budget.pk for budget in budgets],
+            period_start__in={budget.period_start for budget in budgets},
+        )
+    }
 
+    to_create, to_update, transitions = [], [], []
     for budget in budgets:
-        spent = (
-            Transaction.objects.filter(
-                user=user,
-                category=budget.category,
-                type=Transaction.EXPENSE,
-                date__gte=get_period_start(budget.period),
-            ).aggregate(total=Sum("amount"))["total"]
-            or 0
+        target = alert_state_for(build_budget_alert(budget))
+        state = existing.get((budget.pk, budget.period_start))
+        if state is None:
+            state = BudgetAlertState(budget=budget, period_start=budget.period_start)
+            to_create.append(state)
+        elif state.state == target and state.spent == budget.spent:
+            continue
+        else:
+            to_update.append(state)
+
+        state.budget = budget
+        state.state = target
+        state.spent = budget.spent
+        if levels[target] > levels[state.notified_state]:
+            state.notified_state = target
+            state.notify_pending = True
+            transitions.append(state)
+
+    with transaction.atomic():
+        BudgetAlertState.objects.bulk_create(to_create, ignore_conflicts=True)
+        BudgetAlertState.objects.bulk_update(
+            to_update, ["state", "spent", "notified_state", "notify_pending"]
         )
+    return transitions
+
+
+def queue_alert_transitions(transitions):
+    """Логирует переходы и ставит рассылку дайджестов после коммита."""
+    for state in transitions:
+        logger.warning(
+            "Budget %s for user=%s category=%s: spent=%s limit=%s",
+            state.state,
+            state.budget.user_id,
+            state.budget.category_name,
+            state.spent,
+            state.budget.limit_amount,
+        )
+    if transitions:
+        from .tasks import deliver_budget_alerts_task
 
-        if spent > 0:
-            limit = float(budget.limit_amount)
-            spent_float = float(spent)
-            percentage = round((spent_float / limit) * 100, 1) if limit > 0 else 0
-
-            alerts.append(
-                {
-                    "category": budget.category.name,
-                    "spent": spent_float,
-                    "limit": limit,
-                    "period": budget.get_period_display(),
-                    "percentage": percentage,
-                    "is_exceeded": spent_float >= limit,
-                    "is_warning": percentage >= 80,
-                }
-            )
+        transaction.on_commit(deliver_budget_alerts_task.delay)
 
-    return alerts
 
+def evaluate_budgets(user):
+    """Проверяет лимиты пользователя и ставит дайджест в очередь при переходах."""
+    budgets = annotate_budget_spend(
+        BudgetLimit.objects.filter(user=user), get_period_starts()
+    ).order_by("pk")
+    transitions = sync_alert_states(list(budgets))
+    queue_alert_transitions(transitions)
+    return transitions
 
-def import_transactions_from_csv(file, user):
-    """
-    Парсит CSV файл и создаёт транзакции для пользователя.
-    Возвращает словарь с результатами: created, errors.
-    Ожидаемые колонки: Date, Amount, Type, Category, Description
+
+def sweep_budget_periods(chunk_size=500):
     """
-    created = []
-    errors = []
-
-    try:
-        decoded = file.read().decode("utf-8-sig")  # utf-8-sig убирает BOM если он есть
-    except UnicodeDecodeError:
-        return {"created": [], "errors": ["File encoding error. Please use UTF-8."]}
-
-    reader = csv.DictReader(io.StringIO(decoded))
-
-    expected_fields = {"Date", "Amount", "Type", "Category", "Description"}
-    if not reader.fieldnames or not expected_fields.issubset(set(reader.fieldnames)):
-        missing = expected_fields - set(reader.fieldnames or [])
-        return {
-            "created": [],
-            "errors": [f"Missing required columns: {', '.join(missing)}"],
-        }
-
-    for line_num, row in enumerate(
-        reader, start=2
-    ):  # start=2 т.к. строка 1 — заголовок
-        row_errors = []
-
-        try:
-            date = datetime.strptime(row["Date"].strip(), "%Y-%m-%d").date()
-        except ValueError:
-            row_errors.append(
-                f"Row {line_num}: invalid date '{row['Date']}' (expected YYYY-MM-DD)"
-            )
+    Периодическая проверка бюджетов всех пользователей.
 
-        try:
-            amount = Decimal(row["Amount"].strip())
-            if amount <= 0:
-                row_errors.append(f"Row {line_num}: amount must be greater than zero")
-        except InvalidOperation:
-            row_errors.append(f"Row {line_num}: invalid amount '{row['Amount']}'")
-
-        transaction_type = row["Type"].strip().lower()
-        if transaction_type not in [Transaction.INCOME, Transaction.EXPENSE]:
-            row_errors.append(
-                f"Row {line_num}: invalid type '{row['Type']}' "
-                f"(expected 'income' or 'expense')"
+    Пользователи обрабатываются пачками по chunk_size: на пачку — выборка
+    id, один запрос лимитов с тратами и сверка состояний (SELECT,
+    bulk_create, bulk_update), независимо от числа пользователей в ней.
+    """
+    started = time.monotonic()
+    period_starts = get_period_starts()
+    users = budgets_count = 0
+    transitions = []
+    last_user_id = 0
+
+    while True:
+        user_ids = list(
+            BudgetLimit.objects.filter(user_id__gt=last_user_id)
+            .values_list("user_id", flat=True)
+            .distinct()
+            .order_by("user_id")[:chunk_size]
+        )
+        if not user_ids:
+            break
+        budgets = list(
+            annotate_budget_spend(
+                BudgetLimit.objects.filter(user_id__in=user_ids), period_starts
             )
+        )
+        transitions.extend(sync_alert_states(budgets))
+        users += len(user_ids)
+        budgets_count += len(budgets)
+        last_user_id = user_ids[-1]
+
+    queue_alert_transitions(transitions)
+    duration = time.monotonic() - started
+    report = {
+        "users": users,
+        "budgets": budgets_count,
+        "transitions": len(transitions),
+        "duration": round(duration, 3),
+        "users_per_second": round(users / duration, 1) if duration else None,
+    }
+    logger.info(
+        "Budget sweep: %(users)s users, %(budgets)s budgets, "
+        "%(transitions)s transitions in %(duration)ss (%(users_per_second)s users/s)",
+        report,
+    )
+    return report
+
+
+def budget_dirty_key(user_id):
+    return f"budget_dirty_{user_id}"
+
+
+def schedule_budget_evaluation(user_id):
+    """
+    Помечает пользователя «грязным» и планирует одну отложенную проверку.
+    Пока флаг стоит, повторные записи новую задачу не ставят — N записей
+    за окно BUDGET_EVALUATION_DEBOUNCE дают одну проверку бюджета.
+    """
+    debounce = settings.BUDGET_EVALUATION_DEBOUNCE
+    # Запас по таймауту: если задача потеряется, флаг истечёт сам.
+    if cache.add(budget_dirty_key(user_id), 1, timeout=debounce + 60):
+        from .tasks import evaluate_user_budgets_task
 
-        if row_errors:
-            errors.extend(row_errors)
-            continue
+        evaluate_user_budgets_task.apply_async(args=[user_id], countdown=debounce)
 
-        category_name = row["Category"].strip()
-        category = None
-        if category_name:
-            category, _ = Category.objects.get_or_create(name=category_name, user=user)
-
-        transaction = Transaction.objects.create(
-            user=user,
-            date=date,
-            amount=amount,
-            type=transaction_type,
-            category=category,
-            description=row["Description"].strip(),
-        )
-        created.append(transaction)
 
-    return {"created": created, "errors": errors}
+def request_budget_evaluation(user):
+    """Проверка бюджета после записи расходов — сразу или отложенно по настройке."""
+    if settings.BUDGET_EVALUATION_MODE == "sync":
+        evaluate_budgets(user)
+    else:
+        user_id = user.pk
+        transaction.on_commit(lambda: schedule_budget_evaluation(user_id))
@@ -1,16 +1,22 @@
-import csv
+from pathlib import Path
 
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.cache import cache
-from django.db.models import Sum
-from django.db.models.functions import TruncMonth
-from django.http import HttpResponse
-from django.shortcuts import redirect, render
+from django.db import transaction
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_protect
 from django.views.generic import (
     CreateView,
@@ -22,17 +28,44 @@ from django.views.generic import (
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .bulk import write_transaction_batch
+from .caching import (
+    DATA_CACHE_TIMEOUT,
+    data_cache_key,
+    data_etag,
+    get_budget_alerts,
+    get_budget_forecast,
+    get_statistics,
+    refresh_statistics,
+    refresh_statistics_allowed,
+)
+from .exporters import (
+    copy_csv_chunks,
+    create_export_job,
+    export_rows,
+    resolve_export_mode,
+    stream_csv,
+)
 from .forms import BudgetLimitForm, CSVImportForm, RegisterForm, TransactionForm
-from .models import BudgetLimit, Category, Transaction
+from .importers import create_import_job, import_job_status
+from .models import BudgetLimit, Category, ExportJob, ImportJob, Transaction
+from .pagination import TransactionPagination
+from .reports import RangeTooLong, time_series, transaction_summary
 from .serializers import (
     BudgetLimitSerializer,
     CategorySerializer,
+    SummaryQuerySerializer,
+    TimeSeriesQuerySerializer,
+    TransactionBatchSerializer,
     TransactionSerializer,
 )
-from .utils import check_budget_limits, import_transactions_from_csv
+
+# Сколько клиент может не перепроверять кэшируемые отчёты API.
+DATA_MAX_AGE = 60
 
 
 @method_decorator(csrf_protect, name="dispatch")
@@ -65,32 +98,15 @@ class TransactionListView(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        queryset = (
-            Transaction.objects.filter(user=self.request.user)
+        return (
+            Transaction.objects.filtered(self.request.user, self.request.GET)
             .select_related("category")
             .order_by("-date")
         )
 
-        transaction_type = self.request.GET.get("type")
-        if transaction_type in [Transaction.INCOME, Transaction.EXPENSE]:
-            queryset = queryset.filter(type=transaction_type)
-
-        category_id = self.request.GET.get("category")
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
-
-        date_from = self.request.GET.get("date_from")
-        date_to = self.request.GET.get("date_to")
-        if date_from:
-            queryset = queryset.filter(date__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(date__lte=date_to)
-
-        return queryset
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["alerts"] = check_budget_limits(self.request.user)
+        context["alerts"] = get_budget_alerts(self.request.user)
         context["categories"] = Category.objects.filter(
             user=self.request.user
         ).order_by("name")
@@ -183,39 +199,73 @@ class BudgetLimitListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["alerts"] = check_budget_limits(self.request.user)
+        context["alerts"] = get_budget_alerts(self.request.user)
+        forecasts = {
+            forecast["id"]: forecast
+            for forecast in get_budget_forecast(self.request.user)
+        }
+        context["budgets"] = list(context["budgets"])
+        for budget in context["budgets"]:
+            budget.forecast = forecasts.get(budget.pk)
         return context
 
     def get_queryset(self):
-        return super().get_queryset().filter(user=self.request.user)
+        return (
+            super()
+            .get_queryset()
+            .filter(user=self.request.user)
+            .select_related("category")
+        )
 
 
 def export_transactions(request):
     if not request.user.is_authenticated:
         return HttpResponse("Unauthorized", status=401)
 
-    response = HttpResponse(content_type="text/csv")
+    # Те же фильтры, что у списка; строки уходят клиенту по мере чтения из БД.
+    transactions = Transaction.objects.filtered(request.user, request.GET).order_by(
+        "-date", "-id"
+    )
+    if resolve_export_mode() == "copy":
+        content = copy_csv_chunks(transactions)
+    else:
+        content = stream_csv(export_rows(transactions))
+    response = StreamingHttpResponse(content, content_type="text/csv")
     response["Content-Disposition"] = 'attachment; filename="transactions.csv"'
+    return response
 
-    writer = csv.writer(response)
-    writer.writerow(["Date", "Amount", "Type", "Category", "Description"])
 
-    transactions = Transaction.objects.filter(user=request.user).select_related(
-        "category"
-    )
+@login_required
+def start_export(request):
+    """Фоновая выгрузка с фильтрами списка; для больших историй."""
+    if request.method != "POST":
+        return redirect("transactions:list")
+    export_format = request.POST.get("format")
+    if export_format not in dict(ExportJob.FORMAT_CHOICES):
+        export_format = ExportJob.CSV
+    job, created = create_export_job(request.user, export_format, request.POST)
+    if created:
+        messages.success(request, "Export started.")
+    return redirect(job)
 
-    for t in transactions:
-        writer.writerow(
-            [
-                t.date.strftime("%Y-%m-%d"),
-                t.amount,
-                t.get_type_display(),
-                t.category.name if t.category else "",
-                t.description,
-            ]
-        )
 
-    return response
+@login_required
+def export_job_detail(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    return render(request, "transactions/export_job.html", {"job": job})
+
+
+@login_required
+def export_job_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    if job.status != ExportJob.DONE or not job.file:
+        raise Http404("Export is not ready.")
+    return FileResponse(
+        job.file.open("rb"),
+        as_attachment=True,
+        filename=job.download_name,
+        content_type="application/gzip",
+    )
 
 
 class CategoryDetailView(LoginRequiredMixin, DetailView):
@@ -230,6 +280,7 @@ class CategoryDetailView(LoginRequiredMixin, DetailView):
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ["type", "category"]
     ordering_fields = ["date", "amount"]
@@ -252,28 +303,101 @@ class TransactionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    @action(detail=False, methods=["get"], url_path="summary")
-    def summary(self, request):
-        """Сводка: общий доход, расход и баланс пользователя."""
-        from django.db.models import Sum
-
-        qs = Transaction.objects.filter(user=request.user)
-        income = (
-            qs.filter(type=Transaction.INCOME).aggregate(total=Sum("amount"))["total"]
-            or 0
-        )
-        expense = (
-            qs.filter(type=Transaction.EXPENSE).aggregate(total=Sum("amount"))["total"]
-            or 0
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """
+        Пакетная запись: до 5000 созданий, изменений и удалений за запрос.
+        Пакет проверяется целиком; при любой ошибке ничего не пишется и
+        ответ 400 несёт ошибки по индексам элементов. Иначе всё применяется
+        bulk-операциями в той же транзакции БД, в которой изменяемые строки
+        были заблокированы при проверке.
+        """
+        batch = TransactionBatchSerializer(
+            data=request.data, context=self.get_serializer_context()
         )
+        with transaction.atomic():
+            batch.is_valid(raise_exception=True)
+            data = batch.validated_data
+            created, updated = write_transaction_batch(
+                request.user, data["create"], data["update"], data["delete"]
+            )
         return Response(
             {
-                "income": float(income),
-                "expense": float(expense),
-                "balance": float(income - expense),
+                "created": TransactionSerializer(created, many=True).data,
+                "updated": TransactionSerializer(updated, many=True).data,
+                "deleted": [instance.pk for instance in data["delete"]],
             }
         )
 
+    def cached_response(self, request, prefix, query, compute):
+        """
+        Ответ из кэша под ключом версии данных пользователя. ETag привязан
+        к той же версии, так что опрос без изменений получает 304 без
+        обращения к БД, а любая запись данных делает ключ устаревшим.
+        """
+        key = data_cache_key(prefix, request.user.id, sorted(query.items()))
+        etag = data_etag(key)
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={DATA_MAX_AGE}"}
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=304, headers=headers)
+
+        data = cache.get(key)
+        if data is None:
+            data = compute()
+            cache.set(key, data, DATA_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
+
+    @action(detail=False, methods=["get"], url_path="summary")
+    def summary(self, request):
+        """
+        Доход, расход, баланс и число транзакций с фильтрами списка
+        (date_from, date_to, category, type); ?split=category добавляет
+        разбивку по категориям.
+        """
+        params = SummaryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        return self.cached_response(
+            request,
+            "summary",
+            query,
+            lambda: transaction_summary(
+                request.user,
+                date_from=query.get("date_from"),
+                date_to=query.get("date_to"),
+                category=query.get("category"),
+                type_=query.get("type"),
+                by_category=query.get("split") == "category",
+            ),
+        )
+
+    @action(detail=False, methods=["get"], url_path="timeseries")
+    def timeseries(self, request):
+        """
+        Суммы по корзинам day/week/month/year с нулями в пропусках.
+        ?split=category разбивает ряды по категориям.
+        """
+        params = TimeSeriesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        try:
+            return self.cached_response(
+                request,
+                "timeseries",
+                query,
+                lambda: time_series(
+                    request.user,
+                    granularity=query["granularity"],
+                    date_from=query.get("date_from"),
+                    date_to=query.get("date_to"),
+                    by_category=query.get("split") == "category",
+                    type_=query.get("type"),
+                    max_buckets=params.MAX_BUCKETS,
+                ),
+            )
+        except RangeTooLong as exc:
+            raise ValidationError(str(exc))
+
 
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
@@ -298,52 +422,23 @@ class BudgetLimitViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=["get"], url_path="forecast")
+    def forecast(self, request):
+        """Прогноз трат на конец периода и дата превышения по каждому лимиту."""
+        return Response(get_budget_forecast(request.user))
+
 
 @login_required
 def statistics_view(request):
-    cache_key = f"stats_{request.user.id}"
-    data = cache.get(cache_key)
-
-    if not data:
-        income_data = (
-            Transaction.objects.filter(user=request.user, type=Transaction.INCOME)
-            .annotate(month=TruncMonth("date"))
-            .values("month")
-            .annotate(total=Sum("amount"))
-            .order_by("month")
-        )
-
-        expense_data = (
-            Transaction.objects.filter(user=request.user, type=Transaction.EXPENSE)
-            .annotate(month=TruncMonth("date"))
-            .values("month")
-            .annotate(total=Sum("amount"))
-            .order_by("month")
-        )
-
-        months = list(
-            {item["month"].strftime("%Y-%m") for item in income_data}
-            | {item["month"].strftime("%Y-%m") for item in expense_data}
-        )
-        months.sort()
+    if request.GET.get("refresh") == "true":
+        if refresh_statistics_allowed(request.user.id):
+            refresh_statistics(request.user)
+            messages.success(request, "Statistics refreshed.")
+        else:
+            messages.info(request, "Statistics were refreshed less than a minute ago.")
+        return redirect("transactions:statistics")
 
-        income_amounts = {
-            item["month"].strftime("%Y-%m"): float(item["total"])
-            for item in income_data
-        }
-        expense_amounts = {
-            item["month"].strftime("%Y-%m"): float(item["total"])
-            for item in expense_data
-        }
-
-        data = {
-            "months": months,
-            "income": [income_amounts.get(month, 0) for month in months],
-            "expense": [expense_amounts.get(month, 0) for month in months],
-        }
-        cache.set(cache_key, data, 60 * 15)
-
-    return render(request, "statistics.html", data)
+    return render(request, "statistics.html", get_statistics(request.user))
 
 
 def register(request):
@@ -367,7 +462,7 @@ def home(request):
     )
 
     context = {
-        "alerts": check_budget_limits(request.user),
+        "alerts": get_budget_alerts(request.user),
         "recent_transactions": recent_transactions,
     }
     return render(request, "transactions/home.html", context)
@@ -378,24 +473,43 @@ def import_transactions(request):
     if request.method == "POST":
         form = CSVImportForm(request.POST, request.FILES)
         if form.is_valid():
-            result = import_transactions_from_csv(
-                request.FILES["csv_file"], request.user
-            )
-            created_count = len(result["created"])
-            errors = result["errors"]
-
-            if created_count:
-                messages.success(
-                    request, f"Successfully imported {created_count} transaction(s)."
-                )
-            if errors:
-                for error in errors:
-                    messages.warning(request, error)
-            if not created_count and not errors:
-                messages.info(request, "The file was empty or had no valid rows.")
-
-            return redirect("transactions:list")
+            job, created = create_import_job(request.user, request.FILES["csv_file"])
+            if created:
+                messages.success(request, "Import started.")
+            else:
+                messages.info(request, "This file has already been uploaded.")
+            return redirect(job)
     else:
         form = CSVImportForm()
 
     return render(request, "transactions/import_transactions.html", {"form": form})
+
+
+@login_required
+def import_job_detail(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk, user=request.user)
+    return render(
+        request,
+        "transactions/import_job.html",
+        {"job": job, "status": import_job_status(job)},
+    )
+
+
+@login_required
+def import_job_status_view(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk, user=request.user)
+    return JsonResponse(import_job_status(job))
+
+
+@login_required
+def import_job_errors(request, pk):
+    """Полный список ошибок импорта — gzip-текст по строке на ошибку."""
+    job = get_object_or_404(ImportJob, pk=pk, user=request.user)
+    if not job.error_report:
+        raise Http404("No error report for this import.")
+    return FileResponse(
+        job.error_report.open("rb"),
+        as_attachment=True,
+        filename=f"{Path(job.file_name).stem}-errors.txt.gz",
+        content_type="application/gzip",
+    )